@@ -0,0 +1,88 @@
+"""
+Command line entry point of the workflow:
+
+    python beamenergy.py [--root DIR] [--config FILE] [--trace FILE] \
+        {select,cutscan,boost,energy,eval,monitor,draw} [stage arguments]
+
+Only the modules of the requested stage are imported, so the heavy
+dependencies (uproot, iminuit, matplotlib, ...) are paid only by the stages
+and workers that use them. See `python beamenergy.py <stage> --help`.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import REMAINDER, ArgumentParser
+from pathlib import Path
+import importlib
+import os
+import runpy
+import sys
+
+from config import CONFIG_ENV, ROOT_ENV
+from instrumentation import TRACE_ENV
+
+REPO = Path(__file__).parent
+# stage -> (directory, module with `main(argv)`)
+STAGES = {
+    "select": (Path(REPO, "select"), "select_driver"),
+    "cutscan": (Path(REPO, "select"), "cut_scan"),
+    "boost": (Path(REPO, "boost"), "driver"),
+    "energy": (REPO, "eval_energy"),
+    "eval": (REPO, "eval_mean"),
+    "monitor": (REPO, "monitor"),
+}
+DRAWINGS = {
+    "comparison": Path(REPO, "draw/delta_e_comparison.py"),
+    "diff": Path(REPO, "draw/delta_e_diff.py"),
+    "batch": Path(REPO, "draw/batch.py"),
+}
+
+
+def run_stage(stage: str, argv: list[str]):
+    directory, module = STAGES[stage]
+    # the stages run in the caller's directory, so relative arguments hold
+    sys.path.insert(0, str(directory))
+    importlib.import_module(module).main(argv)
+
+
+def run_drawing(argv: list[str]):
+    parser = ArgumentParser(prog="beamenergy draw")
+    parser.add_argument("drawings", nargs="+", choices=list(DRAWINGS))
+    args = parser.parse_args(argv)
+    sys.path.insert(0, str(Path(REPO, "draw")))
+    for drawing in args.drawings:
+        sys.argv = [str(DRAWINGS[drawing])]
+        runpy.run_path(str(DRAWINGS[drawing]), run_name="__main__")
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(
+        prog="beamenergy", description="Beam energy from charged kaon momenta."
+    )
+    parser.add_argument("--root", default=None, help=f"root folder, see {ROOT_ENV}")
+    parser.add_argument(
+        "--config", type=Path, default=None, help="TOML file with `root_folder`"
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    parser.add_argument("stage", choices=[*STAGES, "draw"])
+    parser.add_argument("args", nargs=REMAINDER, help="arguments of the stage")
+    args = parser.parse_args(argv)
+
+    # the stages read the configuration on import, the workers inherit it
+    if args.root is not None:
+        os.environ[ROOT_ENV] = str(Path(args.root).resolve())
+    if args.config is not None:
+        os.environ[CONFIG_ENV] = str(args.config.resolve())
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    if args.stage == "draw":
+        run_drawing(args.args)
+    else:
+        run_stage(args.stage, args.args)
+
+
+if __name__ == "__main__":
+    main()
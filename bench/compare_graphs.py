@@ -0,0 +1,105 @@
+"""
+Check of the Python kaon energies (`eval/kch_energy.py`) against the graphs
+of `eval/evaluate_energy.cpp` for the same `kChargedTree`.
+
+The run groups must be the same, and so must the failed fits. The group
+energies must agree within `--tolerance` of their errors, 0.1 by default,
+and no closer than the 1e-4 MeV rounding of `read_graph`. The energy errors
+must agree within `--error-tolerance`, relative, 5% by default. The
+differences come from the minimizers: Minuit with "SEQM" in ROOT,
+`scipy.optimize.curve_fit` in Python, both chi2 fits skipping empty bins.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+import sys
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+from eval.graphs import read_graph
+from eval.kch_energy import evaluate_groups, fill_run_histograms, read_bad_runs
+
+MIN_TOLERANCE = 1e-4  # MeV, the rounding of `read_graph`
+
+
+def compare_groups(
+    input: Path,
+    cpp_graph: Path,
+    bad_runs: set[int] | None = None,
+    max_group_size: int = 30,
+    tolerance: float = 0.1,
+    error_tolerance: float = 0.05,
+) -> bool:
+    """Whether the groups of `input` agree with the C++ graph, the differences
+    are printed."""
+    groups = evaluate_groups(fill_run_histograms(input, bad_runs), max_group_size)
+    cpp = read_graph(cpp_graph)
+    if not np.array_equal(cpp.runs, groups.first_runs):
+        print(
+            f"Different run groups: {len(cpp.runs)} in C++, "
+            f"{len(groups.first_runs)} in Python"
+        )
+        missing = np.setxor1d(cpp.runs, groups.first_runs)
+        print(f"First runs of only one of them: {missing.astype(int).tolist()}")
+        return False
+
+    # failed fits are zeros in the graphs, NaN after `read_graph`
+    failed = groups.energy_errors == 0
+    energies = np.where(failed, np.nan, np.round(groups.energies, 4))
+    errors = np.where(failed, np.nan, np.round(groups.energy_errors, 4))
+    is_same_failed = np.isnan(cpp.energies) == failed
+
+    diff = np.abs(energies - cpp.energies)
+    allowed = np.maximum(tolerance * cpp.energy_errors, MIN_TOLERANCE)
+    is_energy_ok = np.isnan(diff) | (diff <= allowed)
+    error_diff = np.abs(errors / cpp.energy_errors - 1)
+    is_error_ok = np.isnan(error_diff) | (error_diff <= error_tolerance)
+
+    is_ok = is_same_failed & is_energy_ok & is_error_ok
+    pulls = diff / cpp.energy_errors
+    if not is_ok.all():
+        print(
+            f"{'first run':>10}{'C++, MeV':>22}{'Python, MeV':>22}"
+            f"{'diff / error':>14}"
+        )
+    for i in np.flatnonzero(~is_ok):
+        print(
+            f"{int(cpp.runs[i]):>10}"
+            f"{cpp.energies[i]:>13.4f} ± {cpp.energy_errors[i]:<6.4f}"
+            f"{energies[i]:>13.4f} ± {errors[i]:<6.4f}"
+            f"{pulls[i]:>14.3f}"
+        )
+    fitted = ~np.isnan(diff)
+    print(
+        f"Groups: {len(is_ok)}, fitted: {fitted.sum()}, disagree: {(~is_ok).sum()}"
+        f", max diff / error: {np.max(pulls[fitted], initial=0):.3f}"
+    )
+    return bool(is_ok.all())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Compare the Python kaon energies with the C++ graph."
+    )
+    parser.add_argument("input", type=Path, help="kChargedTree file of a point")
+    parser.add_argument("cpp_graph", type=Path, help="grKchEnergy of evaluate_energy")
+    parser.add_argument("--bad-runs", type=Path, default=None)
+    parser.add_argument("--max-group-size", type=int, default=30)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="of the errors")
+    parser.add_argument("--error-tolerance", type=float, default=0.05)
+    args = parser.parse_args()
+
+    bad_runs = read_bad_runs(args.bad_runs) if args.bad_runs is not None else None
+    is_same = compare_groups(
+        args.input,
+        args.cpp_graph,
+        bad_runs,
+        args.max_group_size,
+        args.tolerance,
+        args.error_tolerance,
+    )
+    print("Same groups" if is_same else "Different groups")
+    sys.exit(0 if is_same else 1)
@@ -0,0 +1,168 @@
+"""
+Benchmark of the boost and eval stages on synthetic inputs.
+
+Every stage is run `--repeat` times and the best wall time is reported
+together with the throughput. The results are written as JSON.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "boost"))
+from eval import prepare_dataframe as prep
+from eval.average import season_averager, ultimate_averager as avg
+from eval.utils import make_a_point
+from processing import eval_boost, eval_boost_chunked
+from synthetic import make_kcharged_tree, make_season
+
+
+def best_time(func: Callable, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def record(stage: str, engine: str, size: int, unit: str, seconds: float) -> dict:
+    result = {
+        "stage": stage,
+        "engine": engine,
+        "size": size,
+        "unit": unit,
+        "seconds": round(seconds, 6),
+        "throughput": round(size / seconds, 3) if seconds > 0 else None,
+    }
+    print(
+        f"{stage:<20}{engine:<12}{size:>12} {unit:<7}{seconds:>10.4f} s"
+        f"{result['throughput'] or 0:>14.1f} {unit}/s",
+        flush=True,
+    )
+    return result
+
+
+def bench_boost(
+    workdir: Path, n_events: int, repeat: int, engines: list[str], step_size: str
+) -> list[dict]:
+    input, output = Path(workdir, "kpkm_bench.root"), Path(workdir, "boost_bench.root")
+    make_kcharged_tree(input, n_events)
+    results = []
+    for engine in engines:
+        seconds = best_time(partial(eval_boost, input, output, engine=engine), repeat)
+        results.append(record("eval_boost", engine, n_events, "events", seconds))
+    seconds = best_time(partial(eval_boost_chunked, input, output, step_size), repeat)
+    results.append(record("eval_boost", "chunked", n_events, "events", seconds))
+    return results
+
+
+def bench_eval(workdir: Path, n_points: int, n_runs: int, repeat: int) -> list[dict]:
+    energies = list(np.linspace(502, 530, n_points).round(1))
+    season = make_season(Path(workdir, "season"), energies=energies, n_runs=n_runs)
+    points = make_a_point(season)
+    n_total = n_runs * len(points)
+    tables = {point.name: prep.retrieve_raw_table(point) for point in points}
+    dfs = {
+        point.name: prep.add_energies(point, tables[point.name].copy())
+        for point in points
+    }
+
+    def read_tables():
+        for point in points:
+            prep.retrieve_raw_table(point)
+
+    def add_energies():
+        for point in points:
+            prep.add_energies(point, tables[point.name].copy())
+
+    def average():
+        for df in dfs.values():
+            avg(df.dropna())
+            avg(df.dropna(), e_mean_key="delta_e")
+
+    # the incremental eval_mean starts the fits of a point from its last results
+    previous = {
+        name: (avg(df.dropna()), avg(df.dropna(), e_mean_key="delta_e"))
+        for name, df in dfs.items()
+    }
+
+    def average_warm():
+        for name, df in dfs.items():
+            avg(df.dropna(), start=previous[name][0])
+            avg(df.dropna(), e_mean_key="delta_e", start=previous[name][1])
+
+    season_df = pd.concat(
+        [df.dropna().assign(point=name) for name, df in dfs.items()], ignore_index=True
+    )
+
+    def average_season():
+        season_averager(season_df)
+        season_averager(season_df, e_mean_key="delta_e")
+
+    def evaluate_points():
+        for point in points:
+            df = prep.add_energies(point, prep.retrieve_raw_table(point)).dropna()
+            avg(df)
+            avg(df, e_mean_key="delta_e")
+
+    stages = [
+        ("retrieve_raw_table", "csv", read_tables),
+        ("add_energies", "join", add_energies),
+        ("ultimate_averager", "minuit", average),
+        ("ultimate_averager", "warm", average_warm),
+        ("season_averager", "batched", average_season),
+        ("eval_mean", "serial", evaluate_points),
+    ]
+    return [
+        record(stage, engine, n_total, "runs", best_time(func, repeat))
+        for stage, engine, func in stages
+    ]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--events", type=float, default=1e5, help="K+K- events")
+    parser.add_argument("--points", type=int, default=10, help="energy points")
+    parser.add_argument("--runs", type=int, default=100, help="runs per point")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--engines", nargs="+", default=["columnar"], help="eval_boost engines"
+    )
+    parser.add_argument("--step-size", default="100 MB")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as workdir:
+        results = bench_boost(
+            Path(workdir), int(args.events), args.repeat, args.engines, args.step_size
+        )
+        results += bench_eval(Path(workdir), args.points, args.runs, args.repeat)
+
+    args.output.write_text(
+        json.dumps(
+            {
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "parameters": vars(args) | {"output": str(args.output)},
+                "results": results,
+            },
+            indent=4,
+        )
+    )
+    print(f"Results saved: {args.output}")
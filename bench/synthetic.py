@@ -0,0 +1,174 @@
+"""
+Synthetic inputs of the pipeline: `kChargedTree` files, `grKchEnergy` graphs,
+Compton tables and season info tables, at a configurable scale.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from pathlib import Path
+import sys
+
+import awkward as ak
+import numpy as np
+import pandas as pd
+import uproot as up
+
+sys.path.append(str(Path(__file__).parent.parent))
+from eval.utils import Season
+
+KAON_MASS = 493.677  # MeV
+FIRST_RUN = 60000
+
+
+def run_energies(
+    energy: float, runs: np.ndarray, rng: np.random.Generator
+) -> np.ndarray:
+    """Beam energy of every run with a slow drift, [MeV]."""
+    return energy + 0.05 * np.sin(runs / 50) + rng.normal(0, 0.01, len(runs))
+
+
+def make_kcharged_tree(
+    output: Path,
+    n_events: int,
+    energy: float = 509.0,
+    runs: np.ndarray | None = None,
+    seed: int = 0,
+    chunk_size: int = 1_000_000,
+):
+    """Write a `kChargedTree` of selected K+K- events (K+ first) in chunks."""
+    if runs is None:
+        runs = np.arange(FIRST_RUN, FIRST_RUN + 100)
+    rng = np.random.default_rng(seed)
+    energies = run_energies(energy, runs, rng)
+    with up.recreate(output) as file:
+        for start in range(0, n_events, chunk_size):
+            n = min(chunk_size, n_events - start)
+            run_idx = np.sort(rng.integers(0, len(runs), n))
+            beam = energies[run_idx]
+            p = np.sqrt(beam**2 - KAON_MASS**2)
+            theta = np.arccos(rng.uniform(-0.8, 0.8, n))
+            phi = rng.uniform(0, 2 * np.pi, n)
+            mom = np.stack([p, p], axis=1) + rng.normal(0, 3, (n, 2))
+            # angular resolution, the K- is tilted to give a nonzero total pz
+            thetas = np.stack([theta, np.pi - theta], axis=1) + rng.normal(
+                [0, -0.005], 0.01, (n, 2)
+            )
+            phis = np.stack([phi, (phi + np.pi) % (2 * np.pi)], axis=1)
+            dedx = rng.normal(12000, 1500, (n, 2))
+
+            def tracks(values: np.ndarray) -> ak.Array:
+                return ak.unflatten(values.astype(np.float64).ravel(), np.full(n, 2))
+
+            columns = {
+                "ebeam": np.full(n, energy, dtype=np.float32),
+                "emeas": beam.astype(np.float32),
+                "demeas": np.full(n, 0.01, dtype=np.float32),
+                "runnum": runs[run_idx].astype(np.int32),
+                "charge": tracks(np.tile([1.0, -1.0], (n, 1))),
+                "tptot": tracks(mom + rng.normal(0, 1, (n, 2))),
+                "tth": tracks(thetas),
+                "tphi": tracks(phis),
+                "tptotv": tracks(mom),
+                "tthv": tracks(thetas),
+                "tphiv": tracks(phis),
+                "tdedx": tracks(dedx),
+            }
+            if start == 0:
+                file.mktree("kChargedTree", columns)
+            else:
+                file["kChargedTree"].extend(columns)
+
+
+def make_energy_graph(
+    output: Path,
+    runs: np.ndarray,
+    energy: float = 509.0,
+    seed: int = 0,
+    missing_fraction: float = 0.05,
+):
+    """Write a `grKchEnergy` graph of per-run K+- energies.
+
+    uproot can't write TGraphErrors, so the graph is a tree with
+    its `fX`, `fY`, `fEX` and `fEY` arrays as branches.
+    """
+    rng = np.random.default_rng(seed)
+    energies = run_energies(energy, runs, rng) + rng.normal(0, 0.03, len(runs))
+    errors = rng.uniform(0.02, 0.06, len(runs))
+    missing = rng.random(len(runs)) < missing_fraction
+    energies[missing], errors[missing] = 0, 0
+    with up.recreate(output) as file:
+        file.mktree(
+            "grKchEnergy",
+            {
+                "fX": runs.astype(np.float64),
+                "fY": energies,
+                "fEX": np.zeros(len(runs)),
+                "fEY": errors,
+            },
+        )
+
+
+def make_compton_table(
+    output: Path,
+    runs: np.ndarray,
+    energy: float = 509.0,
+    runs_per_row: int = 4,
+    seed: int = 0,
+):
+    """Write a Compton table with one row per group of `runs_per_row` runs."""
+    rng = np.random.default_rng(seed)
+    firsts = runs[::runs_per_row]
+    lasts = np.append(firsts[1:] - 1, runs[-1])
+    n = len(firsts)
+    pd.DataFrame(
+        {
+            "run_first": firsts,
+            "run_last": lasts,
+            "e_mean": run_energies(energy, firsts, rng) + 4,
+            "e_std": rng.uniform(0.01, 0.05, n),
+            "spread_mean": rng.normal(0.37, 0.02, n),
+            "spread_std": rng.uniform(0.005, 0.02, n),
+            "luminosity": rng.uniform(1, 20, n),
+            "accepted": np.ones(n, dtype=int),
+        }
+    ).to_csv(output, index=False)
+
+
+def make_season(
+    root: Path,
+    name: str = "Phi2024",
+    energies: list[float] | None = None,
+    n_runs: int = 100,
+    seed: int = 0,
+) -> Season:
+    """Create season info, graphs and Compton tables of a synthetic season."""
+    if energies is None:
+        energies = [505.0, 508.5, 509.0, 509.5, 510.0, 511.0]
+    season = Season(
+        name=name,
+        season_info=Path(root, f"tables/{name.lower()}.csv"),
+        graphs_location=Path(root, f"results/{name}/graphs"),
+        compton_tables=Path(root, f"tables/Compton/energy_points/{name.upper()}"),
+        output_tables=Path(root, f"tables/k_charged/{name.upper()}"),
+    )
+    for directory in [
+        season.season_info.parent,
+        season.graphs_location,
+        season.compton_tables,
+        season.output_tables,
+    ]:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    info = []
+    for i, energy in enumerate(energies):
+        point = f"{energy:g}"
+        runs = np.arange(n_runs) + FIRST_RUN + i * n_runs
+        graph = Path(season.graphs_location, f"graph_scan{name[-4:]}_e{point}.root")
+        make_energy_graph(graph, runs, energy, seed + i)
+        table = Path(season.compton_tables, f"{point}_{runs[0]}.csv")
+        make_compton_table(table, runs, energy, seed=seed + i)
+        info.append(
+            {"energy_point": point, "mean_energy": energy, "first_run": runs[0]}
+        )
+    pd.DataFrame(info).to_csv(season.season_info, index=False)
+    return season
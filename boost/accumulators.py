@@ -0,0 +1,82 @@
+"""
+Mergeable accumulators for chunk-by-chunk processing.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class RunningMoments:
+    """Running count, mean and variance (Chan et al. parallel update)."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def fill(self, data: np.ndarray) -> "RunningMoments":
+        data = np.asarray(data, dtype=np.float64)
+        if data.size == 0:
+            return self
+        chunk_mean = float(data.mean())
+        chunk_m2 = float(((data - chunk_mean) ** 2).sum())
+        return self.merge(RunningMoments(data.size, chunk_mean, chunk_m2))
+
+    def merge(self, other: "RunningMoments") -> "RunningMoments":
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta**2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (ddof=1), the same as `pd.Series.var`."""
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+
+@dataclass
+class Histogram:
+    """Uniformly binned histogram that is filled chunk by chunk.
+
+    Histograms with the same binning can be merged, e.g. across worker processes.
+    """
+
+    n_bins: int
+    range: tuple[float, float]
+    counts: np.ndarray = field(init=False)
+
+    def __post_init__(self):
+        self.counts = np.zeros(self.n_bins, dtype=np.int64)
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.linspace(*self.range, self.n_bins + 1)
+
+    @property
+    def bin_width(self) -> float:
+        return abs(self.range[1] - self.range[0]) / self.n_bins
+
+    def fill(self, data: np.ndarray) -> "Histogram":
+        self.counts += np.histogram(data, bins=self.n_bins, range=self.range)[0]
+        return self
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        if self.n_bins != other.n_bins or tuple(self.range) != tuple(other.range):
+            raise ValueError("Can't merge histograms with different binning.")
+        self.counts += other.counts
+        return self
+
+    def to_numpy(self) -> tuple[np.ndarray, np.ndarray]:
+        """(counts, edges) pair, the format `uproot` writes as TH1D."""
+        return self.counts, self.edges
@@ -1,22 +1,113 @@
+from argparse import ArgumentParser
+from multiprocessing.pool import Pool
 from pathlib import Path
-
-from utils import ROOT_FOLDER, hist
-from processing import eval_boost
+import os
+import re
 import time
 
-season_name = "Phi2024"
-energy_name = "509"
-
-key = f"scan{season_name[-4:]}_e{energy_name}"
-input = Path(ROOT_FOLDER, f"data/{season_name}/kpkm_{key}.root")
-output = Path(ROOT_FOLDER, f"boost/data/boost_{key}.root")
-plot_output = Path(ROOT_FOLDER, f"boost/plots/total_pz_{key}.svg")
+from accumulators import Histogram
+from utils import ROOT_FOLDER, render_hist
+from processing import eval_boost, eval_boost_chunked
+from instrumentation import TRACE_ENV, point_context
 
 n_bins = 1000
 pz_range = (-20, 20)  # MeV
 
-start = time.time()
-df = eval_boost(input, output)
-hist(df["tot_pz"], n_bins, pz_range, plot_output)
-end = time.time()
-print(f"Execution took: {round(end - start, 2)} s or {round((end - start)/60, 2)} m")
+
+def discover_inputs(seasons: list[str]) -> list[Path]:
+    """Find every `data/<season>/kpkm_scan*_e*.root` file of the given seasons."""
+    inputs = []
+    for season_name in seasons:
+        season_dir = Path(ROOT_FOLDER, f"data/{season_name}")
+        inputs += sorted(season_dir.glob("kpkm_scan*_e*.root"))
+    return inputs
+
+
+def point_key(input: Path) -> str:
+    return input.stem.removeprefix("kpkm_")
+
+
+def process_point(
+    input: Path, engine: str, plot: str, step_size: int | str | None = None
+) -> dict:
+    key = point_key(input)
+    output = Path(ROOT_FOLDER, f"boost/data/boost_{key}.root")
+    plot_output = Path(ROOT_FOLDER, f"boost/plots/total_pz_{key}.{plot}")
+
+    start = time.time()
+    with point_context(key):
+        if step_size is None:
+            h = Histogram(n_bins, pz_range)
+            df = eval_boost(input, output, engine=engine, histogram=h)  # type: ignore
+            n_events, mean, std = len(df), df["tot_pz"].mean(), df["tot_pz"].std()
+        else:
+            summary = eval_boost_chunked(input, output, step_size, n_bins, pz_range)
+            h, moments = summary.histogram, summary.moments
+            n_events, mean, std = moments.count, moments.mean, moments.std
+        if plot != "none":
+            import matplotlib
+
+            matplotlib.use("Agg")
+            render_hist(h, plot_output, dpi=100 if plot == "png" else None)
+    end = time.time()
+    return {
+        "key": key,
+        "n_events": n_events,
+        "tot_pz_mean": mean,
+        "tot_pz_std": std,
+        "wall_time": end - start,
+    }
+
+
+def _sort_key(result: dict) -> tuple[str, float]:
+    match = re.search(r"scan(\d+)_e(\d+\.?\d*)", result["key"])
+    return (match.group(1), float(match.group(2))) if match else (result["key"], 0)
+
+
+def print_table(results: list[dict]):
+    print(
+        f"{'point':<22}{'events':>10}{'mean, MeV':>12}{'std, MeV':>12}{'time, s':>10}"
+    )
+    for res in sorted(results, key=_sort_key):
+        print(
+            f"{res['key']:<22}{res['n_events']:>10}{res['tot_pz_mean']:>12.4f}"
+            f"{res['tot_pz_std']:>12.4f}{res['wall_time']:>10.2f}"
+        )
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(description="Evaluate total pz for every energy point.")
+    parser.add_argument("--seasons", nargs="+", default=["Phi2018", "Phi2024"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--engine", choices=["columnar", "pandas"], default="columnar")
+    parser.add_argument("--plot", choices=["svg", "png", "none"], default="svg")
+    parser.add_argument(
+        "--step-size",
+        type=lambda s: int(s) if s.isdigit() else s,
+        default=None,
+        help='stream input in chunks of entries or bytes, e.g. 100000 or "100 MB"',
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    inputs = discover_inputs(args.seasons)
+    print(f"Number of points: {len(inputs)}")
+
+    start = time.time()
+    with Pool(min(args.workers, max(len(inputs), 1))) as pool:
+        results = pool.starmap(
+            process_point,
+            [(inp, args.engine, args.plot, args.step_size) for inp in inputs],
+        )
+    end = time.time()
+
+    print_table(results)
+    print(f"Execution took: {round(end - start, 2)} s or {round((end - start)/60, 2)} m")
+
+
+if __name__ == "__main__":
+    main()
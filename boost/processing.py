@@ -1,15 +1,71 @@
-import vector
+from dataclasses import dataclass, field
+from typing import Literal
+
+import awkward as ak
 import uproot as up
 from pathlib import Path
 import pandas as pd
 import numpy as np
+import sys
+
+from accumulators import Histogram, RunningMoments
+
+sys.path.append(str(Path(__file__).parent.parent))
+from instrumentation import span
+
+KAON_MASS = 493.677  # MeV
+
+_ALIASES = {"energy": "emeas", "mom": "tptotv", "theta": "tthv", "phi": "tphiv"}
+_BRANCHES = ["energy", "mom", "theta", "phi"]
+
+
+def _split_tracks(tracks: ak.Array) -> tuple[np.ndarray, np.ndarray]:
+    """Split a two-track branch into (K+, K-) columns.
+
+    The selection stores K+ first, so every event holds exactly two entries,
+    either as a variable-length array or as a fixed-size float32[2] one.
+    """
+    pairs = ak.to_numpy(ak.to_regular(tracks, axis=1)).astype(np.float64)
+    return pairs[:, 0], pairs[:, 1]
 
 
-def eval_boost(input: Path, output: Path) -> pd.DataFrame:
-    aliases = {"energy": "emeas", "mom": "tptotv", "theta": "tthv", "phi": "tphiv"}
-    branches = ["energy", "mom", "theta", "phi"]
-    with up.open(f"{input.as_posix()}:kChargedTree") as tree:  # type: ignore
-        df: pd.DataFrame = tree.arrays(branches, aliases=aliases, library="pd")
+def _kaon_columns(arrays: ak.Array) -> dict[str, np.ndarray]:
+    """Compute per-kaon columns and the total pz of the K+K- pair as whole arrays."""
+    columns = {"energy": ak.to_numpy(arrays["energy"])}
+    for branch in ["mom", "theta", "phi"]:
+        columns[f"{branch}_K_pos"], columns[f"{branch}_K_neg"] = _split_tracks(
+            arrays[branch]
+        )
+    for charge in ["pos", "neg"]:
+        columns[f"pt_K_{charge}"] = columns[f"mom_K_{charge}"] * np.sin(
+            columns[f"theta_K_{charge}"]
+        )
+    columns["Mass"] = np.full(len(columns["energy"]), KAON_MASS)
+    columns["tot_pz"] = columns["mom_K_pos"] * np.cos(
+        columns["theta_K_pos"]
+    ) + columns["mom_K_neg"] * np.cos(columns["theta_K_neg"])
+    return columns
+
+
+def _eval_boost_columnar(input: Path) -> pd.DataFrame:
+    with span("read kChargedTree", "io") as info:
+        with up.open(f"{input.as_posix()}:kChargedTree") as tree:  # type: ignore
+            arrays = tree.arrays(_BRANCHES, aliases=_ALIASES, library="ak")
+        info["events"] = len(arrays)
+    with span("kaon columns", "transform"):
+        return pd.DataFrame(_kaon_columns(arrays))
+
+
+def _eval_boost_pandas(input: Path) -> pd.DataFrame:
+    with span("read kChargedTree", "io"):
+        with up.open(f"{input.as_posix()}:kChargedTree") as tree:  # type: ignore
+            df: pd.DataFrame = tree.arrays(_BRANCHES, aliases=_ALIASES, library="pd")
+    with span("kaon columns", "transform"):
+        return _kaon_dataframe(df)
+
+
+def _kaon_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    import vector
 
     for branch in ["mom", "theta", "phi"]:
         df[f"{branch}_K_pos"] = df[branch].apply(lambda x: x[0])
@@ -21,7 +77,7 @@ def eval_boost(input: Path, output: Path) -> pd.DataFrame:
     df["pt_K_neg"] = df[["mom_K_neg", "theta_K_neg"]].apply(
         lambda x: x["mom_K_neg"] * np.sin(x["theta_K_neg"]), axis="columns"
     )
-    df["Mass"] = [493.677] * len(df)
+    df["Mass"] = [KAON_MASS] * len(df)
     arr_pos = vector.array(
         {
             "pt": df["pt_K_pos"],
@@ -41,10 +97,123 @@ def eval_boost(input: Path, output: Path) -> pd.DataFrame:
 
     sum = arr_neg.add(arr_pos)
     df["tot_pz"] = sum.to_ptphipz().z
+    return df
 
-    with up.recreate(output) as new_file:
-        new_file["boost"] = df
+
+def eval_boost(
+    input: Path,
+    output: Path,
+    engine: Literal["columnar", "pandas"] = "columnar",
+    histogram: Histogram | None = None,
+) -> pd.DataFrame:
+    """Evaluate the total pz of K+K- pairs and save it to the `boost` tree.
+
+    Parameters
+    ----------
+    input : Path
+        file with the `kChargedTree` tree of selected events
+    output : Path
+        file to write the `boost` tree to
+    engine : {"columnar", "pandas"}
+        "columnar" slices the K+/K- tracks as whole arrays;
+        "pandas" is the original row-wise implementation, kept for cross-checks
+    histogram : Histogram | None
+        if given, it is filled with tot_pz and saved as `tot_pz_hist`
+        next to the `boost` tree
+
+    Returns
+    -------
+    pd.DataFrame
+        per-event kaon columns and `tot_pz`
+    """
+    if engine == "columnar":
+        df = _eval_boost_columnar(input)
+    elif engine == "pandas":
+        df = _eval_boost_pandas(input)
+    else:
+        raise ValueError(f"Unknown eval_boost engine: {engine}")
+
+    with span("write boost", "io"), up.recreate(output) as new_file:
+        new_file.mktree("boost", df)
+        if histogram is not None:
+            new_file["tot_pz_hist"] = histogram.fill(df["tot_pz"]).to_numpy()
     print("Total pz mean =", df["tot_pz"].mean())
-    print("Total pz std =", df["tot_pz"].std() ** 0.5)
+    print("Total pz std =", df["tot_pz"].std())
     print(f"Output tree `boost` is saved in {output}")
     return df
+
+
+@dataclass
+class BoostSummary:
+    """Running tot_pz statistics of a streamed `eval_boost` pass."""
+
+    histogram: Histogram
+    moments: RunningMoments = field(default_factory=RunningMoments)
+    n_chunks: int = 0
+
+    def fill(self, tot_pz: np.ndarray):
+        self.moments.fill(tot_pz)
+        self.histogram.fill(tot_pz)
+        self.n_chunks += 1
+
+
+def eval_boost_chunked(
+    input: Path,
+    output: Path,
+    step_size: int | str = "100 MB",
+    n_bins: int = 1000,
+    pz_range: tuple[float, float] = (-20, 20),
+) -> BoostSummary:
+    """Streaming version of `eval_boost` with memory bounded by `step_size`.
+
+    Each chunk of `kChargedTree` is appended to the output `boost` tree,
+    only the running tot_pz moments and histogram counts are kept.
+    The histogram is saved as `tot_pz_hist` next to the `boost` tree.
+
+    Parameters
+    ----------
+    input : Path
+        file with the `kChargedTree` tree of selected events
+    output : Path
+        file to write the `boost` tree to
+    step_size : int | str
+        number of entries or memory size (e.g. "100 MB") per chunk,
+        as understood by `uproot.iterate`
+    n_bins : int
+        number of tot_pz histogram bins
+    pz_range : tuple[float, float]
+        tot_pz histogram range, [MeV]
+
+    Returns
+    -------
+    BoostSummary
+        tot_pz moments and histogram counts
+    """
+    summary = BoostSummary(Histogram(n_bins, pz_range))
+    with up.recreate(output) as new_file:
+        chunks = up.iterate(
+            f"{input.as_posix()}:kChargedTree",
+            _BRANCHES,
+            aliases=_ALIASES,
+            step_size=step_size,
+            library="ak",
+        )
+        while True:
+            with span("read kChargedTree", "io", chunk=summary.n_chunks):
+                arrays = next(chunks, None)
+            if arrays is None:
+                break
+            with span("kaon columns", "transform", chunk=summary.n_chunks):
+                columns = _kaon_columns(arrays)
+            with span("write boost", "io", chunk=summary.n_chunks):
+                if summary.n_chunks == 0:
+                    new_file.mktree("boost", columns)
+                else:
+                    new_file["boost"].extend(columns)
+            summary.fill(columns["tot_pz"])
+        new_file["tot_pz_hist"] = summary.histogram.to_numpy()
+
+    print("Total pz mean =", summary.moments.mean)
+    print("Total pz std =", summary.moments.std)
+    print(f"Output tree `boost` is saved in {output} ({summary.n_chunks} chunks)")
+    return summary
@@ -1,22 +1,32 @@
 from pathlib import Path
-import matplotlib.pyplot as plt
-from plothist import make_hist, plot_hist
 
 import sys
 
 sys.path.append(str(Path(__file__).parent.parent))
-from secret import ROOT_FOLDER
+from config import ROOT_FOLDER
+from accumulators import Histogram
+from instrumentation import span
 
 
-def hist(data, n_bins: int, pz_range: tuple[float, float], plot_output: Path):
-    fig, ax = plt.subplots()
-    h = make_hist(data, bins=n_bins, range=pz_range)
-    bin_width = round(abs(pz_range[1] - pz_range[0]) / n_bins, 3)
+def render_hist(h: Histogram, plot_output: Path, dpi: int | None = None):
+    """Render accumulated tot_pz counts. The format follows the `plot_output` suffix."""
+    import matplotlib.pyplot as plt
+    from plothist import make_hist, plot_hist
+
+    with span("tot_pz histogram", "plot", output=plot_output):
+        fig, ax = plt.subplots()
+        centers = (h.edges[1:] + h.edges[:-1]) / 2
+        bh = make_hist(centers, bins=h.n_bins, range=h.range, weights=h.counts)
 
-    plot_hist(h, ax=ax)
+        plot_hist(bh, ax=ax)
 
-    ax.set_xlabel(r"Total p_{z}, MeV")
-    ax.set_ylabel(f"Entries/{bin_width} MeV")
+        ax.set_xlabel(r"Total p_{z}, MeV")
+        ax.set_ylabel(f"Entries/{round(h.bin_width, 3)} MeV")
 
-    fig.savefig(plot_output, bbox_inches="tight")  # type: ignore
+        fig.savefig(plot_output, bbox_inches="tight", dpi=dpi)  # type: ignore
+        plt.close(fig)
     print(f"Output file saved: {plot_output}")
+
+
+def hist(data, n_bins: int, pz_range: tuple[float, float], plot_output: Path):
+    render_hist(Histogram(n_bins, pz_range).fill(data), plot_output)
@@ -0,0 +1,51 @@
+"""
+Configuration of the pipeline.
+
+The root folder of the data, tables and results is taken from, in order:
+* the `BEAMENERGY_ROOT` environment variable,
+* `root_folder` of the TOML file named by `BEAMENERGY_CONFIG`,
+  or of `beamenergy.toml` next to this file, or of `~/.config/beamenergy.toml`,
+* `ROOT_FOLDER` of the legacy `secret` module.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from pathlib import Path
+import os
+import tomllib
+
+ROOT_ENV = "BEAMENERGY_ROOT"
+CONFIG_ENV = "BEAMENERGY_CONFIG"
+
+
+def config_files() -> list[Path]:
+    if os.environ.get(CONFIG_ENV):
+        return [Path(os.environ[CONFIG_ENV])]
+    return [
+        Path(Path(__file__).parent, "beamenergy.toml"),
+        Path(Path.home(), ".config/beamenergy.toml"),
+    ]
+
+
+def load_root_folder() -> str:
+    if os.environ.get(ROOT_ENV):
+        return os.environ[ROOT_ENV]
+    for config in config_files():
+        if config.exists():
+            with open(config, "rb") as file:
+                return tomllib.load(file)["root_folder"]
+    try:
+        from secret import ROOT_FOLDER
+    except ImportError:
+        raise RuntimeError(
+            f"The root folder is not configured: set {ROOT_ENV}, or `root_folder`"
+            f" in one of {', '.join(map(str, config_files()))}"
+        ) from None
+    return ROOT_FOLDER
+
+
+def __getattr__(name: str):
+    # resolved on first use, so the entry point can set the environment first
+    if name == "ROOT_FOLDER":
+        return load_root_folder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
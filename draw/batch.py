@@ -0,0 +1,115 @@
+"""
+Batch rendering of the ΔE comparison plots of every energy point found in
+both seasons, and of the 2024-2018 difference plot, in a process pool:
+
+    python batch.py [--workers N] [--format svg] [--version VERSION]
+
+The plots are rendered with the non-interactive Agg backend. The ΔE
+interpolator of Phi2018 is built once for the difference plot.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from multiprocessing.pool import Pool
+from pathlib import Path
+import os
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from utils import ROOT_FOLDER
+from plots import (
+    accepted_values,
+    delta_e_interpolator,
+    draw_comparison,
+    draw_diff,
+    energy_diff,
+)
+from eval.results_store import ResultsStore
+
+tables = {
+    "Phi2018": Path(ROOT_FOLDER, "tables/k_charged/RHO2018"),
+    "Phi2024": Path(ROOT_FOLDER, "tables/k_charged/PHI2024"),
+}
+results = Path(ROOT_FOLDER, "results")
+
+
+def common_points() -> list[str]:
+    """Energy points with output tables in both seasons, sorted by energy."""
+    points = [
+        {table.stem.split("_e", 1)[1] for table in folder.glob(f"{season}_e*.csv")}
+        for season, folder in tables.items()
+    ]
+    return sorted(set.intersection(*points), key=float)
+
+
+def render_comparison(point: str, variable: str, n_bins: int, fmt: str) -> Path:
+    x2018, x2024 = (
+        accepted_values(Path(folder, f"{season}_e{point}.csv"), variable)
+        for season, folder in tables.items()
+    )
+    output = Path(results, f"delta_E_comparison_{point}_MeV.{fmt}")
+    return draw_comparison(x2018, x2024, output, n_bins)
+
+
+def render_diff(store_path: Path, version: str | None, fmt: str) -> Path:
+    with ResultsStore(store_path) as store:
+        fits = {
+            (name, result_set): store.query(
+                name,
+                energy_range=(505 if name == "Phi2024" else 0, float("inf")),
+                result_set=result_set,
+                version=version,
+            )
+            for name in tables
+            for result_set in ["", "_delta_E"]
+        }
+    interpolator = delta_e_interpolator(
+        fits["Phi2018", ""], fits["Phi2018", "_delta_E"]
+    )
+    diff = energy_diff(
+        interpolator, fits["Phi2024", ""], fits["Phi2024", "_delta_E"]
+    )
+    return draw_diff(diff, Path(results, f"delta_E_diff.{fmt}"))
+
+
+def _render(task: tuple) -> Path:
+    render, *args = task
+    return render(*args)
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(description="Render all ΔE plots.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--format", choices=["svg", "png", "pdf"], default="svg")
+    parser.add_argument("--variable", default="delta_e")
+    parser.add_argument("--n-bins", type=int, default=28)
+    parser.add_argument(
+        "--store", type=Path, default=Path(results, "results.sqlite")
+    )
+    parser.add_argument(
+        "--version", default=None, help="run of the results, the latest by default"
+    )
+    args = parser.parse_args(argv)
+
+    tasks: list[tuple] = [
+        (render_comparison, point, args.variable, args.n_bins, args.format)
+        for point in common_points()
+    ]
+    if args.store.exists():
+        tasks.append((render_diff, args.store, args.version, args.format))
+    print(f"Number of plots: {len(tasks)}")
+
+    start = time.time()
+    with Pool(min(args.workers, max(len(tasks), 1))) as pool:
+        for output in pool.imap_unordered(_render, tasks):
+            print(f"Output file saved: {output}")
+    end = time.time()
+    print(f"Execution took: {round(end - start, 2)} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Data preparation and rendering of the ΔE comparison and 2024-2018 difference
+plots, shared by the single plot scripts and `batch.py`.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from plothist import make_hist, plot_hist
+from scipy.interpolate import Akima1DInterpolator
+
+from utils import span
+
+
+def accepted_values(table: Path, variable: str = "delta_e") -> np.ndarray:
+    """Values of the accepted rows of an output table of `eval_mean.py`."""
+    df = pd.read_csv(table).dropna()
+    return df[variable].to_numpy()[df["accepted"].to_numpy() == 1]
+
+
+def comparison_range(*samples: np.ndarray) -> tuple[float, float]:
+    values = np.concatenate(samples)
+    return values.min() * 0.98, values.max() * 1.02
+
+
+def draw_comparison(
+    x2018: np.ndarray, x2024: np.ndarray, output: Path, n_bins: int = 28
+) -> Path:
+    x_range = comparison_range(x2018, x2024)
+    bin_width = round((x_range[1] - x_range[0]) / n_bins, 2)
+    h2018 = make_hist(x2018, bins=n_bins, range=x_range)
+    h2024 = make_hist(x2024, bins=n_bins, range=x_range)
+
+    fig, ax = plt.subplots()
+
+    plot_hist(h2018, ax=ax, histtype="step", linewidth=1.2, label="PHI2018")
+    plot_hist(h2024, ax=ax, histtype="step", linewidth=1.2, label="PHI2024")
+
+    ax.set_xlabel(r"\Delta E, MeV")
+    ax.set_ylabel(f"Entries/{bin_width} MeV")
+    ax.set_xlim(x_range)
+    ax.legend()
+
+    with span("delta E comparison", "plot", output=output):
+        fig.savefig(output, bbox_inches="tight")  # type: ignore
+    plt.close(fig)
+    return output
+
+
+def delta_e_interpolator(
+    energies: pd.DataFrame, delta_e: pd.DataFrame, max_error: float = 0.1
+) -> Akima1DInterpolator:
+    """ΔE of a season as a function of its mean energy, built once per season.
+    The points with a statistical or systematic error above `max_error` are skipped.
+    """
+    df = energies.merge(delta_e, on="key", suffixes=("", "_delta_e"))
+    good = (df["mean_energy_stat_err"] <= max_error) & (
+        df["mean_energy_sys_err"] <= max_error
+    )
+    df = df[good].sort_values("mean_energy")
+    return Akima1DInterpolator(
+        df["mean_energy"].to_numpy(), df["mean_energy_delta_e"].to_numpy()
+    )
+
+
+def energy_diff(
+    interpolator: Akima1DInterpolator, energies: pd.DataFrame, delta_e: pd.DataFrame
+) -> pd.DataFrame:
+    """Difference of the ΔE of the points from the interpolated ΔE of another season.
+
+    Returns
+    -------
+    pd.DataFrame
+        `point`, `diff` and its error `diff_err` (the mean energy error) columns
+    """
+    df = energies.merge(delta_e, on="key", suffixes=("", "_delta_e"))
+    return pd.DataFrame(
+        {
+            "point": df["point"],
+            "diff": df["mean_energy_delta_e"] - interpolator(df["mean_energy"]),
+            "diff_err": np.hypot(
+                df["mean_energy_stat_err"], df["mean_energy_sys_err"]
+            ),
+        }
+    )
+
+
+def draw_diff(diff: pd.DataFrame, output: Path) -> Path:
+    fig, ax = plt.subplots()
+    ax.errorbar(diff["point"], diff["diff"], yerr=diff["diff_err"], fmt="o")
+
+    ax.set_xlabel(r"Phi2024 Energy point")
+    ax.set_ylabel(r"2024-2018 diff, MeV")
+
+    with span("delta E diff", "plot", output=output):
+        fig.savefig(output, bbox_inches="tight")  # type: ignore
+    plt.close(fig)
+    return output
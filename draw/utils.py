@@ -2,4 +2,5 @@ from pathlib import Path
 import sys
 
 sys.path.append(str(Path(__file__).parent.parent))
-from secret import ROOT_FOLDER
+from config import ROOT_FOLDER
+from instrumentation import span
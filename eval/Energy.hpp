@@ -14,6 +14,7 @@
 #include <algorithm>
 #include <iostream>
 #include <fstream>
+#include <stdexcept>
 
 #include "TROOT.h"
 #include "TH2D.h"
@@ -74,6 +75,8 @@ private:
     std::pair<double, double> Eval(int run, bool isVerbose = true); 
     std::pair<double, double> Eval(std::vector<int> &runGroup, bool isVerbose = true); 
     int ReadBadRuns(std::string filename);
+    // Throws if kTr lacks the branches of `kpkmExp::Loop` or their std::vector<double> tracks.
+    void CheckLayout(std::string fChargedK);
 
 public:
     int GetGroupsNum();
@@ -97,6 +100,7 @@ Energy::Energy(std::string fChargedK, std::string fBadRunsList, int maxGroupSize
 {
     TFile *file = TFile::Open(fChargedK.c_str());
     kTr = (TTree *)file->Get("kChargedTree");
+    CheckLayout(fChargedK);
     
     energyShift = shiftToKchEnergy;
     verbose = isVerbose;
@@ -116,6 +120,30 @@ Energy::Energy(std::string fChargedK, std::string fBadRunsList, int maxGroupSize
     DivideIntoGroups(maxGroupSize);
 }
 
+void Energy::CheckLayout(std::string fChargedK)
+{
+    if(kTr == nullptr)
+    { throw std::runtime_error(fChargedK + ": no kChargedTree"); }
+    for(std::string name : {"ebeam", "emeas", "demeas", "runnum", "tdedx", "tptotv"})
+    {
+        if(kTr->GetBranch(name.c_str()) == nullptr)
+        { 
+            throw std::runtime_error(fChargedK + ": kChargedTree has no " + name + " branch, "
+                                     "a compact schema of the python selection can't be read here, "
+                                     "select with `select_driver.py --engine root` or use eval_energy.py");
+        }
+    }
+    for(std::string name : {"tdedx", "tptotv"})
+    {
+        if(std::string(kTr->GetBranch(name.c_str())->GetClassName()) != "vector<double>")
+        { 
+            throw std::runtime_error(fChargedK + ": " + name + " is not a std::vector<double> branch, "
+                                     "the output of the python selection can't be read here, "
+                                     "select with `select_driver.py --engine root` or use eval_energy.py");
+        }
+    }
+}
+
 int Energy::ReadBadRuns(std::string filename)
 {
     std::ifstream input(filename);
@@ -5,10 +5,11 @@ Developed by Nikita Petrov (source: https://cmd.inp.nsk.su/~compton/gogs/compton
 Tailored by Daniel Ivanov (daniilivanov1606@gmail.com)
 """
 
-from iminuit import Minuit
 import numpy as np
 import pandas as pd
 
+from instrumentation import span
+
 
 class Likelihood:
     """
@@ -27,8 +28,9 @@ class Likelihood:
             array of luminosities
         """
 
-        self.means = means
-        self.sigmas = sigmas
+        self.means = np.asarray(means, dtype=np.float64)
+        self.variances = np.asarray(sigmas, dtype=np.float64) ** 2
+        weights = np.asarray(weights, dtype=np.float64)
         self.weights = weights / weights.mean()
         # w_norm = (weights**2).sum()/(weights.sum())
         # self.weights = weights/w_norm
@@ -45,75 +47,254 @@ class Likelihood:
             expected standard deviation
         """
 
-        sigma_total = np.sqrt(sigma**2 + self.sigmas**2)
+        variance_total = sigma**2 + self.variances
         ln_L = -np.sum(
             self.weights
             * (
-                ((mean - self.means) ** 2) / (2 * (sigma_total**2))
-                + np.log(sigma_total)
+                ((mean - self.means) ** 2) / (2 * variance_total)
+                + 0.5 * np.log(variance_total)
             )
         )
         return -ln_L
 
+    def grad(self, mean: float, sigma: float) -> np.ndarray:
+        """
+        Analytic gradient of the negative log-likelihood w.r.t. (mean, sigma)
+        """
 
-def __estimate_point_with_closest(
-    comb_df: pd.DataFrame, runs_df: pd.DataFrame, compton_df: pd.DataFrame
-):
-    # estimate energy by the nearest points
-    min_run_time = (
-        runs_df[runs_df.run == comb_df.iloc[0].at["run_first"]].iloc[0].at["starttime"]
-    )
-    max_run_time = (
-        runs_df[runs_df.run == comb_df.iloc[0].at["run_last"]].iloc[0].at["stoptime"]
-    )
+        variance_total = sigma**2 + self.variances
+        residual = mean - self.means
+        d_mean = np.sum(self.weights * residual / variance_total)
+        d_sigma = sigma * np.sum(
+            self.weights * (1 / variance_total - residual**2 / variance_total**2)
+        )
+        return np.array([d_mean, d_sigma])
+
+
+class BatchLikelihood:
+    """
+    Stack of independent `Likelihood` functions over 2D (batch x run) arrays.
+    Rows may be padded, padding entries must have zero weight.
+    """
+
+    def __init__(self, means: np.ndarray, sigmas: np.ndarray, weights: np.ndarray):
+        """
+        Parameters
+        ----------
+        means : np.array
+            2D array of means, [MeV]
+        sigmas : np.array
+            2D array of standard deviations, [MeV]
+        weights : np.array
+            2D array of luminosities, 0 for padding
+        """
+
+        weights = np.asarray(weights, dtype=np.float64)
+        self.valid = weights > 0
+        n_valid = self.valid.sum(axis=1, keepdims=True)
+        self.weights = weights / (weights.sum(axis=1, keepdims=True) / n_valid)
+        self.means = np.where(self.valid, means, 0.0)
+        self.variances = np.where(self.valid, np.asarray(sigmas) ** 2, 1.0)
 
-    nearest_row_before = compton_df.iloc[
-        pd.Index(compton_df.endtime).get_loc(min_run_time, "nearest")
-    ]
-    nearest_row_after = compton_df.iloc[
-        pd.Index(compton_df.begintime).get_loc(max_run_time, "nearest")
-    ]
-
-    # regulatization
-    nearest_row_before["data"][1] = max(nearest_row_before["data"][3], 1e-3)
-    nearest_row_after["data"][3] = max(nearest_row_after["data"][3], 1e-3)
-    nearest_row_before["data"][1] = max(nearest_row_before["data"][1], 1e-3)
-    nearest_row_after["data"][3] = max(nearest_row_after["data"][3], 1e-3)
-
-    mean_energy = (nearest_row_before["data"][0] + nearest_row_after["data"][0]) / 2
-    mean_spread = (nearest_row_before["data"][2] + nearest_row_after["data"][2]) / 2
-    std_energy = np.sqrt(
-        1
-        / (
-            1 / (nearest_row_before["data"][1]) ** 2
-            + 1 / (nearest_row_after["data"][1]) ** 2
+    def __call__(self, mean: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+        variance_total = sigma[:, None] ** 2 + self.variances
+        return np.sum(
+            self.weights
+            * (
+                ((mean[:, None] - self.means) ** 2) / (2 * variance_total)
+                + 0.5 * np.log(variance_total)
+            ),
+            axis=1,
         )
-    )
-    std_spread = np.sqrt(
-        1
-        / (
-            1 / (nearest_row_before["data"][3]) ** 2
-            + 1 / (nearest_row_after["data"][3]) ** 2
+
+    def mean_error(self, mean: np.ndarray, sigma: np.ndarray) -> np.ndarray:
+        """
+        Hesse error of the mean, i.e. from the inverse of the (mean, sigma) Hessian
+        """
+
+        variance_total = sigma[:, None] ** 2 + self.variances
+        residual = mean[:, None] - self.means
+        w = self.weights
+        h_mm = np.sum(w / variance_total, axis=1)
+        h_ms = -2 * sigma * np.sum(w * residual / variance_total**2, axis=1)
+        h_ss = np.sum(
+            w * (1 / variance_total - residual**2 / variance_total**2), axis=1
+        ) + 2 * sigma**2 * np.sum(
+            w * (2 * residual**2 / variance_total**3 - 1 / variance_total**2), axis=1
+        )
+        det = h_mm * h_ss - h_ms**2
+        var_mean = np.where(
+            (det > 0) & (sigma > 1e-6), h_ss / np.where(det > 0, det, 1), 1 / h_mm
         )
+        return np.sqrt(var_mean)
+
+    def fit(self, max_iter: int = 200, tol: float = 1e-9) -> dict[str, np.ndarray]:
+        """
+        Fisher scoring in (mean, sigma**2) with sigma >= 0, started like
+        `ultimate_averager` from the sample mean and std of every row.
+
+        Returns
+        -------
+        dict
+            arrays of `mean`, `sigma`, `mean_err`, `converged`
+        """
+
+        n_valid = self.valid.sum(axis=1)
+        mean = self.means.sum(axis=1) / n_valid
+        var = np.sum(
+            np.where(self.valid, (self.means - mean[:, None]) ** 2, 0), axis=1
+        ) / n_valid
+        converged = np.zeros(len(mean), dtype=bool)
+        for _ in range(max_iter):
+            variance_total = var[:, None] + self.variances
+            inv = self.weights / variance_total
+            new_mean = np.sum(inv * self.means, axis=1) / np.sum(inv, axis=1)
+            residual = new_mean[:, None] - self.means
+            # score and expected information for sigma**2
+            score = np.sum(inv * (residual**2 / variance_total - 1), axis=1)
+            info = np.sum(inv / variance_total, axis=1)
+            new_var = np.maximum(var + score / info, 0)
+            converged = (np.abs(new_mean - mean) < tol) & (
+                np.abs(new_var - var) < tol * np.maximum(var, 1)
+            )
+            mean, var = new_mean, new_var
+            if converged.all():
+                break
+        sigma = np.sqrt(var)
+        return {
+            "mean": mean,
+            "sigma": sigma,
+            "mean_err": self.mean_error(mean, sigma),
+            "converged": converged,
+        }
+
+
+def batch_spread(
+    spread_means: np.ndarray, spread_stds: np.ndarray, luminosity: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Luminosity weighted spread of every row, as in `ultimate_averager`.
+    Padding entries must have zero luminosity."""
+    valid = luminosity > 0
+    inv = np.where(valid, luminosity / np.where(valid, spread_stds, 1) ** 2, 0)
+    mean_spread = np.sum(inv * np.where(valid, spread_means, 0), axis=1) / np.sum(
+        inv, axis=1
     )
-    sys_energy = np.std([nearest_row_before["data"][0], nearest_row_after["data"][0]])
+    lum_mean = luminosity.sum(axis=1) / valid.sum(axis=1)
+    std_spread = np.sqrt(1 / np.sum(inv / lum_mean[:, None], axis=1))
+    return mean_spread, std_spread
+
+
+def _nearest(values: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Positions of the nearest sorted `values` to every query,
+    ties go to the larger value like `pd.Index.get_indexer(method="nearest")`."""
+    right = np.clip(np.searchsorted(values, queries, side="left"), 0, len(values) - 1)
+    left = np.maximum(right - 1, 0)
+    is_right = np.abs(values[right] - queries) <= np.abs(queries - values[left])
+    return np.where(is_right, right, left)
+
+
+class ClosestComptonEstimator:
+    """
+    Energy and spread of run groups without K+- data,
+    estimated by the nearest Compton measurements before and after the group
+    """
+
+    def __init__(
+        self, runs_df: pd.DataFrame, compton_df: pd.DataFrame, min_error: float = 1e-3
+    ):
+        """
+        Parameters
+        ----------
+        runs_df : pd.DataFrame
+            runs with `run`, `starttime` and `stoptime` columns
+        compton_df : pd.DataFrame
+            Compton measurements with `begintime`, `endtime` and `data` columns,
+            `data` holds [e_mean, e_std, spread_mean, spread_std]
+        min_error : float
+            lower bound of the Compton energy and spread errors, [MeV]
+        """
+        run_order = np.argsort(runs_df["run"].to_numpy(), kind="stable")
+        self.runs = runs_df["run"].to_numpy()[run_order]
+        self.starttimes = runs_df["starttime"].to_numpy()[run_order]
+        self.stoptimes = runs_df["stoptime"].to_numpy()[run_order]
+
+        data = np.array(compton_df["data"].tolist(), dtype=np.float64)[:, :4]
+        data[:, [1, 3]] = np.maximum(data[:, [1, 3]], min_error)
+        self.data = data
+        self.end_order = np.argsort(compton_df["endtime"].to_numpy(), kind="stable")
+        self.endtimes = compton_df["endtime"].to_numpy()[self.end_order]
+        self.begin_order = np.argsort(compton_df["begintime"].to_numpy(), kind="stable")
+        self.begintimes = compton_df["begintime"].to_numpy()[self.begin_order]
+
+    def _run_index(self, runs: np.ndarray) -> np.ndarray:
+        idx = np.clip(np.searchsorted(self.runs, runs), 0, len(self.runs) - 1)
+        missing = self.runs[idx] != runs
+        if missing.any():
+            raise ValueError(f"Runs are not found in runs_df: {runs[missing]}")
+        return idx
+
+    def estimate(
+        self, run_first: np.ndarray, run_last: np.ndarray
+    ) -> dict[str, np.ndarray]:
+        """Estimate every [run_first, run_last] group at once.
+
+        Parameters
+        ----------
+        run_first : np.ndarray
+            first runs of the groups
+        run_last : np.ndarray
+            last runs of the groups
+
+        Returns
+        -------
+        dict[str, np.ndarray]
+            mean energy and spread with their errors, per group
+        """
+        min_run_time = self.starttimes[self._run_index(np.asarray(run_first))]
+        max_run_time = self.stoptimes[self._run_index(np.asarray(run_last))]
+        before = self.data[self.end_order[_nearest(self.endtimes, min_run_time)]]
+        after = self.data[self.begin_order[_nearest(self.begintimes, max_run_time)]]
+        return {
+            "mean_energy": (before[:, 0] + after[:, 0]) / 2,
+            "mean_energy_stat_err": np.sqrt(
+                1 / (1 / before[:, 1] ** 2 + 1 / after[:, 1] ** 2)
+            ),
+            "mean_energy_sys_err": np.abs(before[:, 0] - after[:, 0]) / 2,
+            "mean_spread": (before[:, 2] + after[:, 2]) / 2,
+            "mean_spread_stat_err": np.sqrt(
+                1 / (1 / before[:, 3] ** 2 + 1 / after[:, 3] ** 2)
+            ),
+        }
 
+
+def _estimate_point_with_closest(
+    comb_df: pd.DataFrame,
+    runs_df: pd.DataFrame,
+    compton_df: pd.DataFrame,
+    estimator: ClosestComptonEstimator | None = None,
+):
+    # estimate energy by the nearest points
+    if estimator is None:
+        estimator = ClosestComptonEstimator(runs_df, compton_df)
+    estimate = estimator.estimate(
+        np.array([comb_df.iloc[0].at["run_first"]]),
+        np.array([comb_df.iloc[0].at["run_last"]]),
+    )
     return {
         "energy_point": comb_df.elabel.min(),
         "first_run": comb_df.run_first.min(),
         "last_run": comb_df.run_last.max(),
-        "mean_energy": mean_energy,
-        "mean_energy_stat_err": std_energy,
-        "mean_energy_sys_err": sys_energy,
-        "mean_spread": mean_spread,
-        "mean_spread_stat_err": std_spread,
+        **{key: value[0] for key, value in estimate.items()},
         "used_lum": 0,
         "comment": "indirect measurement #2",
     }, pd.DataFrame([])
 
 
 def ultimate_averager(
-    df: pd.DataFrame, e_mean_key: str = "e_mean", e_std_key: str = "e_std"
+    df: pd.DataFrame,
+    e_mean_key: str = "e_mean",
+    e_std_key: str = "e_std",
+    start: dict | None = None,
 ) -> dict:
     """Complete averager for estimation of mean energy and energy spread
 
@@ -121,22 +302,52 @@ def ultimate_averager(
     ----------
     df : pd.DataFrame
         input dataframe containing means and spreads
+    start : dict | None
+        previous result of `ultimate_averager` for the same point (e.g. the last
+        night's one) to start the fit from, by default the sample mean and std
 
     Returns
     -------
     dict
         averaged mean and spread
     """
+    return minuit_averager(df, e_mean_key, e_std_key, start)[0]
 
-    m = Minuit(
-        Likelihood(df[e_mean_key], df[e_std_key], df["luminosity"]),  # type: ignore
-        mean=df[e_mean_key].mean(),
-        sigma=df[e_mean_key].std(ddof=0),
-    )
+
+def minuit_averager(
+    df: pd.DataFrame,
+    e_mean_key: str = "e_mean",
+    e_std_key: str = "e_std",
+    start: dict | None = None,
+) -> tuple[dict, bool]:
+    """`ultimate_averager` result and whether its Minuit fit is valid"""
+    from iminuit import Minuit
+
+    likelihood = Likelihood(df[e_mean_key], df[e_std_key], df["luminosity"])
+    if start is None:
+        m = Minuit(
+            likelihood,
+            mean=df[e_mean_key].mean(),
+            sigma=df[e_mean_key].std(ddof=0),
+            grad=likelihood.grad,
+        )
+    else:
+        m = Minuit(
+            likelihood,
+            mean=start["mean_energy"],
+            sigma=max(start["mean_energy_sys_err"], 1e-3),
+            grad=likelihood.grad,
+        )
+        m.errors["mean"] = max(start["mean_energy_stat_err"], 1e-3)
     m.errordef = 0.5
     m.limits["sigma"] = (0, None)
-    m.migrad()
-    m.hesse()
+    with span("migrad", "fit", key=e_mean_key) as info:
+        m.migrad()
+        info["nfcn"] = m.nfcn
+    with span("hesse", "fit", key=e_mean_key) as info:
+        nfcn = m.nfcn
+        m.hesse()
+        info["nfcn"] = m.nfcn - nfcn
     sys_err = m.values["sigma"]
     mean_en = m.values["mean"]
 
@@ -152,4 +363,76 @@ def ultimate_averager(
         "mean_energy_sys_err": round(sys_err, 5),
         "mean_spread": mean_spread,
         "mean_spread_stat_err": round(std_spread, 5),
-    }
+    }, m.valid
+
+
+def _pad_groups(
+    df: pd.DataFrame, group_key: str, columns: list[str]
+) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Long-format columns as 2D (group x row) arrays, padded with zeros."""
+    codes, groups = pd.factorize(df[group_key], sort=True)
+    order = np.argsort(codes, kind="stable")
+    sizes = np.bincount(codes, minlength=len(groups))
+    starts = np.cumsum(sizes) - sizes
+    positions = np.arange(len(order)) - np.repeat(starts, sizes)
+    padded = {}
+    for column in columns:
+        values = np.zeros((len(groups), sizes.max(initial=0)))
+        values[codes[order], positions] = df[column].to_numpy(np.float64)[order]
+        padded[column] = values
+    return np.asarray(groups), padded
+
+
+def season_averager(
+    df: pd.DataFrame,
+    point_key: str = "point",
+    e_mean_key: str = "e_mean",
+    e_std_key: str = "e_std",
+    max_iter: int = 200,
+    tol: float = 1e-9,
+) -> dict:
+    """Averager of all energy points of a season in one vectorized fit
+
+    The likelihoods of the points are stacked into a `BatchLikelihood`
+    and fitted together. Points whose fit doesn't converge are refitted
+    with `ultimate_averager`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        long-format dataframe of the season, one row per run group with
+        `point_key`, energy, `luminosity`, `spread_mean` and `spread_std` columns
+    point_key : str
+        column with the energy point of a row
+
+    Returns
+    -------
+    dict
+        energy point -> averaged mean and spread, as of `ultimate_averager`
+    """
+
+    columns = [e_mean_key, e_std_key, "luminosity", "spread_mean", "spread_std"]
+    points, padded = _pad_groups(df, point_key, columns)
+    likelihood = BatchLikelihood(
+        padded[e_mean_key], padded[e_std_key], padded["luminosity"]
+    )
+    fit = likelihood.fit(max_iter=max_iter, tol=tol)
+    mean_spread, std_spread = batch_spread(
+        padded["spread_mean"], padded["spread_std"], padded["luminosity"]
+    )
+
+    results = {}
+    for i, point in enumerate(points):
+        if not fit["converged"][i]:
+            results[point] = ultimate_averager(
+                df[df[point_key] == point], e_mean_key, e_std_key
+            )
+            continue
+        results[point] = {
+            "mean_energy": float(fit["mean"][i]),
+            "mean_energy_stat_err": round(float(fit["mean_err"][i]), 5),
+            "mean_energy_sys_err": round(float(fit["sigma"][i]), 5),
+            "mean_spread": float(mean_spread[i]),
+            "mean_spread_stat_err": round(float(std_spread[i]), 5),
+        }
+    return results
@@ -0,0 +1,152 @@
+"""
+Reader of the `grKchEnergy` graphs of per-run charged kaon energies.
+
+The values are rounded and zeros are masked as NaN once per graph, with
+vectorized operations. The graphs of a season can be loaded into one
+structured array, optionally cached on disk and memory-mapped on reuse.
+
+Besides TGraphErrors (written by ROOT), a `grKchEnergy` TTree with
+`fX`, `fY`, `fEX` and `fEY` branches is accepted, since uproot can't
+write TGraphErrors.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+import json
+import os
+
+import numpy as np
+import uproot as up
+
+from .utils import Point
+
+GRAPH_NAME = "grKchEnergy"
+GRAPH_DTYPE = np.dtype(
+    [("run", np.float64), ("e_mean", np.float64), ("e_std", np.float64)]
+)
+
+
+@dataclass(frozen=True)
+class Graph:
+    runs: np.ndarray
+    energies: np.ndarray
+    energy_errors: np.ndarray
+
+
+def _members(path: Path, name: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    with up.open(path) as file:  # type: ignore
+        graph = file[name]
+        if isinstance(graph, up.behaviors.TTree.TTree):
+            arrays = graph.arrays(["fX", "fY", "fEY"], library="np")
+            return arrays["fX"], arrays["fY"], arrays["fEY"]
+        return graph.member("fX"), graph.member("fY"), graph.member("fEY")
+
+
+def read_graph(path: Path, name: str = GRAPH_NAME, decimals: int = 4) -> Graph:
+    """Read a graph into contiguous views of one (3, n) float64 block.
+
+    Energies and errors are rounded to `decimals`, zero ones are set to NaN.
+    """
+    runs, energies, energy_errors = _members(path, name)
+    block = np.empty((3, len(runs)), dtype=np.float64)
+    block[0] = runs
+    np.round(energies, decimals, out=block[1])
+    np.round(energy_errors, decimals, out=block[2])
+    block[1:, (block[1] == 0) | (block[2] == 0)] = np.nan
+    return Graph(*block)
+
+
+def _identity(path: Path) -> dict[str, int]:
+    stat = path.stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+@dataclass(frozen=True)
+class SeasonGraphs:
+    """Graphs of several energy points in one structured array."""
+
+    table: np.ndarray
+    # energy point -> [start, stop) rows of `table`
+    index: dict[str, tuple[int, int]]
+
+    def __getitem__(self, point_name: str) -> Graph:
+        start, stop = self.index[point_name]
+        rows = self.table[start:stop]
+        return Graph(rows["run"], rows["e_mean"], rows["e_std"])
+
+
+def load_season_graphs(points: list[Point], cache: Path | None = None) -> SeasonGraphs:
+    """Load the graphs of the points into one `GRAPH_DTYPE` array.
+
+    Parameters
+    ----------
+    points : list[Point]
+        energy points of one season
+    cache : Path | None
+        directory of the on-disk cache. The cached array is memory-mapped,
+        and only the graphs whose files changed (mtime or size) are reread
+
+    Returns
+    -------
+    SeasonGraphs
+        the graphs, indexed by energy point name
+    """
+    cached: SeasonGraphs | None = None
+    sources: dict[str, dict] = {}
+    meta_path = None if cache is None else Path(cache, f"{GRAPH_NAME}.json")
+    if meta_path is not None and meta_path.exists():
+        meta = json.loads(meta_path.read_text())
+        index = {name: tuple(rows) for name, rows in meta["index"].items()}
+        try:
+            table_name = meta.get("table", f"{GRAPH_NAME}.npy")
+            table = np.load(Path(meta_path.parent, table_name), mmap_mode="r")
+        except FileNotFoundError:
+            # replaced by another process since the index was read
+            pass
+        else:
+            cached = SeasonGraphs(table, index)
+            sources = meta["sources"]
+
+    graphs: dict[str, Graph] = {}
+    new_sources: dict[str, dict] = {}
+    for point in points:
+        new_sources[point.name] = _identity(point.graph_location)
+        if cached is not None and sources.get(point.name) == new_sources[point.name]:
+            graphs[point.name] = cached[point.name]
+        else:
+            graphs[point.name] = read_graph(point.graph_location)
+    if cached is not None and new_sources == sources:
+        return cached
+
+    table = np.empty(sum(len(graph.runs) for graph in graphs.values()), GRAPH_DTYPE)
+    index, start = {}, 0
+    for name, graph in graphs.items():
+        stop = start + len(graph.runs)
+        table["run"][start:stop] = graph.runs
+        table["e_mean"][start:stop] = graph.energies
+        table["e_std"][start:stop] = graph.energy_errors
+        index[name] = (start, stop)
+        start = stop
+
+    if meta_path is not None:
+        # every table gets a new file, and the index naming it is replaced
+        # last, so readers never pair a table with the index of another one
+        meta_path.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            dir=meta_path.parent, prefix=f"{GRAPH_NAME}-", suffix=".npy", delete=False
+        ) as file:
+            np.save(file, table)
+        meta = {"table": Path(file.name).name, "sources": new_sources, "index": index}
+        with NamedTemporaryFile(
+            "w", dir=meta_path.parent, suffix=".json", delete=False
+        ) as file:
+            json.dump(meta, file, indent=4)
+        old_meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        os.replace(file.name, meta_path)
+        # processes that have the old table mapped keep it until they unmap it
+        old_table = old_meta.get("table", f"{GRAPH_NAME}.npy")
+        Path(meta_path.parent, old_table).unlink(missing_ok=True)
+    return SeasonGraphs(table, index)
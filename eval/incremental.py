@@ -0,0 +1,94 @@
+"""
+Cache of the averaged results keyed on the content hashes of the inputs.
+
+A point is refitted only if its Compton table, its graph or the averager
+settings changed, or its output table is missing. File hashes are reused
+while the file size and mtime stay the same, so an unchanged season costs
+a `stat` per input.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from hashlib import sha256
+from pathlib import Path
+import json
+
+from .utils import Point
+
+
+def file_digest(path: Path, chunk_size: int = 2**20) -> str:
+    digest = sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_hash(settings: object, sources: list[Path]) -> str:
+    """Hash of the averager settings and of the code they run."""
+    digest = sha256(repr(settings).encode())
+    for source in sources:
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Per-point fit results with the hashes of the inputs they were made from
+    """
+
+    def __init__(self, path: Path):
+        """
+        Parameters
+        ----------
+        path : Path
+            JSON file of the cache, created on `save`
+        """
+        self.path = path
+        content = json.loads(path.read_text()) if path.exists() else {}
+        self.files: dict[str, dict] = content.get("files", {})
+        self.points: dict[str, dict] = content.get("points", {})
+
+    def _digest(self, path: Path) -> str:
+        """Content hash of the file, rehashed only if its size or mtime changed."""
+        stat = path.stat()
+        identity = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        known = self.files.get(str(path.resolve()))
+        if known is not None and known["identity"] == identity:
+            return known["sha256"]
+        digest = file_digest(path)
+        self.files[str(path.resolve())] = {"identity": identity, "sha256": digest}
+        return digest
+
+    def input_hashes(self, point: Point, settings: str) -> dict[str, str]:
+        return {
+            "compton_table": self._digest(point.compton_table),
+            "graph": self._digest(point.graph_location),
+            "settings": settings,
+        }
+
+    def get(self, key: str, point: Point, settings: str) -> dict | None:
+        """Cached results of the point, or None if they are out of date."""
+        entry = self.points.get(key)
+        if entry is None or not point.output_table.exists():
+            return None
+        if entry["inputs"] != self.input_hashes(point, settings):
+            return None
+        return entry["results"]
+
+    def previous(self, key: str) -> dict | None:
+        """Last results of the point, even if they are out of date."""
+        entry = self.points.get(key)
+        return None if entry is None else entry["results"]
+
+    def put(self, key: str, point: Point, settings: str, results: dict):
+        self.points[key] = {
+            "inputs": self.input_hashes(point, settings),
+            "results": results,
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(
+            json.dumps({"files": self.files, "points": self.points}, indent=4)
+        )
@@ -8,9 +8,14 @@ The output dataframe has columns:
 Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
 """
 
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+import os
+
+from .graphs import Graph, read_graph
 from .utils import Point
+from instrumentation import span
 import pandas as pd
-import uproot as up
 import numpy as np
 
 
@@ -19,35 +24,84 @@ def retrieve_raw_table(point: Point) -> pd.DataFrame:
     Load  compton energy tables.
     If several tables found for the same energy point,
     the one with highest starting run num is taken.
+    If the season has a `cache_location`, the parsed table is kept there
+    as a pickle and reused until the CSV file changes (mtime or size).
     """
-    df = pd.read_csv(point.compton_table)
+    cache_location = point.season.cache_location
+    if cache_location is None:
+        with span("read Compton table", "io", cache="none"):
+            return pd.read_csv(point.compton_table)
+
+    stat = point.compton_table.stat()
+    source = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    cached = Path(cache_location, f"{point.compton_table.stem}.pkl")
+    if cached.exists():
+        with span("read Compton table", "io") as info:
+            df = pd.read_pickle(cached)
+            info["cache"] = "hit" if df.attrs.get("source") == source else "stale"
+        if df.attrs.get("source") == source:
+            return df
+
+    with span("read Compton table", "io", cache="miss"):
+        df = pd.read_csv(point.compton_table)
+        df.attrs["source"] = source
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        # replaced, not overwritten, so a crash mid-write leaves no corrupt cache
+        with NamedTemporaryFile(dir=cached.parent, suffix=".pkl", delete=False) as file:
+            df.to_pickle(file)
+        os.replace(file.name, cached)
     return df
 
 
-def add_energies(point: Point, df: pd.DataFrame) -> pd.DataFrame:
+def _last_run_in_range(
+    runs: np.ndarray, run_first: np.ndarray, run_last: np.ndarray
+) -> np.ndarray:
+    """For every [run_first, run_last] interval, find the index of the last
+    (in the `runs` order) run inside it, or -1 if there is none."""
+    order = np.argsort(runs, kind="stable")
+    lo = np.searchsorted(runs[order], run_first, side="left")
+    hi = np.searchsorted(runs[order], run_last, side="right")
+    has_run = lo < hi
+    if not has_run.any():
+        return np.full(len(run_first), -1)
+    # max of the original positions over order[lo:hi] for all intervals at once
+    bounds = np.ravel([lo[has_run], hi[has_run]], order="F")
+    last = np.maximum.reduceat(np.append(order, -1), bounds)[::2]
+    run_idx = np.full(len(run_first), -1)
+    run_idx[has_run] = last
+    return run_idx
+
+
+def add_energies(
+    point: Point, df: pd.DataFrame, graph: Graph | None = None
+) -> pd.DataFrame:
     """Add charged K energy measurement data.
     In particular, adds columns:
     * 'e_mean'
     * 'e_std'
+    * 'delta_e'
+
+    Every graph run is joined to the rows with `run_first <= run <= run_last`.
+    Zero energies are treated as missing, and if several runs fall into
+    the same row, the last run of the graph wins.
+    The graph is read from `point.graph_location` unless it is given,
+    e.g. from `load_season_graphs`.
     """
-    with up.open(point.graph_location) as file:  # type: ignore
-        bcs = file["grKchEnergy"]
-    runs: np.ndarray = np.array(bcs.member("fX"))  # type: ignore
-    energies: np.ndarray = np.array(bcs.member("fY"))  # type: ignore
-    energy_errors: np.ndarray = np.array(bcs.member("fEY"))  # type: ignore
+    if graph is None:
+        with span("read grKchEnergy", "io"):
+            graph = read_graph(point.graph_location)
+    runs, energies, energy_errors = graph.runs, graph.energies, graph.energy_errors
 
     df["e_mean_compton"] = df["e_mean"]
     df["e_std_compton"] = df["e_std"]
 
-    df["e_mean"] = [np.nan] * len(df)
-    df["e_std"] = [np.nan] * len(df)
-    df["delta_e"] = [np.nan] * len(df)
-
-    for run, energy, energy_err in zip(runs, energies, energy_errors):
-        energy, energy_err = round(energy, 4), round(energy_err, 4)
-        mask: pd.Series = (df["run_first"] <= run) & (run <= df["run_last"])
-        if energy == 0 or energy_err == 0:
-            energy, energy_err = np.nan, np.nan
-        df.loc[mask, ["e_mean", "e_std"]] = [energy, energy_err]
-        df.loc[mask, "delta_e"] = round(df.loc[mask, "e_mean_compton"] - energy, 4)
+    with span("join graph runs", "transform", rows=len(df), runs=len(runs)):
+        run_idx = _last_run_in_range(
+            runs, df["run_first"].to_numpy(), df["run_last"].to_numpy()
+        )
+        matched = run_idx >= 0
+        for column, values in [("e_mean", energies), ("e_std", energy_errors)]:
+            df[column] = np.nan
+            df.loc[matched, column] = values[run_idx[matched]]
+        df["delta_e"] = np.round(df["e_mean_compton"] - df["e_mean"], 4)
     return df
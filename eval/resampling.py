@@ -0,0 +1,158 @@
+"""
+Bootstrap and toy Monte Carlo uncertainties of the averaged energy.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from functools import partial
+from multiprocessing.pool import Pool
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from .average import BatchLikelihood, batch_spread, minuit_averager
+
+
+def _make_replicas(
+    df: pd.DataFrame,
+    columns: list[str],
+    n_replicas: int,
+    method: Literal["bootstrap", "toy"],
+    rng: np.random.Generator,
+    e_mean_key: str,
+    e_std_key: str,
+) -> dict[str, np.ndarray]:
+    """2D (replica x run) arrays of the resampled columns."""
+    values = {column: df[column].to_numpy(dtype=np.float64) for column in columns}
+    if method == "bootstrap":
+        idx = rng.integers(0, len(df), size=(n_replicas, len(df)))
+        return {column: array[idx] for column, array in values.items()}
+    if method == "toy":
+        replicas = {
+            column: np.broadcast_to(array, (n_replicas, len(df)))
+            for column, array in values.items()
+        }
+        for mean_key, std_key in [
+            (e_mean_key, e_std_key),
+            ("spread_mean", "spread_std"),
+        ]:
+            replicas[mean_key] = rng.normal(
+                values[mean_key], values[std_key], size=(n_replicas, len(df))
+            )
+        return replicas
+    raise ValueError(f"Unknown resampling method: {method}")
+
+
+def _fit_vectorized(
+    replicas: dict[str, np.ndarray], e_mean_key: str, e_std_key: str
+) -> pd.DataFrame:
+    fit = BatchLikelihood(
+        replicas[e_mean_key], replicas[e_std_key], replicas["luminosity"]
+    ).fit()
+    mean_spread, _ = batch_spread(
+        replicas["spread_mean"], replicas["spread_std"], replicas["luminosity"]
+    )
+    return pd.DataFrame(
+        {
+            "mean_energy": fit["mean"],
+            "mean_energy_sys_err": fit["sigma"],
+            "mean_spread": mean_spread,
+            "converged": fit["converged"],
+        }
+    )
+
+
+def _fit_minuit(
+    replicas: dict[str, np.ndarray], e_mean_key: str, e_std_key: str, jobs: int | None
+) -> pd.DataFrame:
+    n_replicas = len(replicas["luminosity"])
+    dfs = [
+        pd.DataFrame({column: array[i] for column, array in replicas.items()})
+        for i in range(n_replicas)
+    ]
+    averager = partial(minuit_averager, e_mean_key=e_mean_key, e_std_key=e_std_key)
+    with Pool(jobs) as pool:
+        fits = pool.map(averager, dfs, chunksize=max(n_replicas // 64, 1))
+    df = pd.DataFrame([result for result, _ in fits])
+    df["converged"] = [valid for _, valid in fits]
+    return df[["mean_energy", "mean_energy_sys_err", "mean_spread", "converged"]]
+
+
+def resample_averager(
+    df: pd.DataFrame,
+    n_replicas: int = 1000,
+    method: Literal["bootstrap", "toy"] = "bootstrap",
+    engine: Literal["vectorized", "minuit"] = "vectorized",
+    e_mean_key: str = "e_mean",
+    e_std_key: str = "e_std",
+    cl: float = 0.6827,
+    seed: int | None = None,
+    jobs: int | None = None,
+) -> dict:
+    """Percentile intervals of `ultimate_averager` results from resampled runs
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        input dataframe, the same as for `ultimate_averager`
+    n_replicas : int
+        number of replicas
+    method : {"bootstrap", "toy"}
+        "bootstrap" draws runs with replacement;
+        "toy" smears means and spreads of every run by their errors
+    engine : {"vectorized", "minuit"}
+        "vectorized" fits all replicas at once with `BatchLikelihood` and refits
+        the ones it didn't converge for with Minuit;
+        "minuit" runs `ultimate_averager` per replica in a process pool of `jobs`
+    cl : float
+        confidence level of the central intervals
+    seed : int | None
+        seed of the random generator
+
+    Returns
+    -------
+    dict
+        median and [lower, upper] interval of the mean energy, the sys term
+        and the spread, number of replicas, of the refitted ones and of the
+        converged ones; the replicas whose Minuit fit failed too are dropped
+    """
+
+    columns = [e_mean_key, e_std_key, "luminosity", "spread_mean", "spread_std"]
+    rng = np.random.default_rng(seed)
+    replicas = _make_replicas(
+        df, columns, n_replicas, method, rng, e_mean_key, e_std_key
+    )
+    n_refitted = 0
+    if engine == "vectorized":
+        fits = _fit_vectorized(replicas, e_mean_key, e_std_key)
+        # as in `season_averager`, the replicas the batch fit didn't converge
+        # for are refitted with Minuit
+        failed = np.flatnonzero(~fits["converged"].to_numpy())
+        if len(failed):
+            refits = _fit_minuit(
+                {column: array[failed] for column, array in replicas.items()},
+                e_mean_key,
+                e_std_key,
+                jobs,
+            )
+            for column in refits.columns:
+                fits.loc[failed, column] = refits[column].to_numpy()
+            n_refitted = len(failed)
+    elif engine == "minuit":
+        fits = _fit_minuit(replicas, e_mean_key, e_std_key, jobs)
+    else:
+        raise ValueError(f"Unknown resampling engine: {engine}")
+
+    good = fits[fits["converged"]]
+    quantiles = [(1 - cl) / 2, 0.5, (1 + cl) / 2]
+    result: dict = {
+        "n_replicas": n_replicas,
+        "n_refitted": n_refitted,
+        "n_converged": len(good),
+        "cl": cl,
+    }
+    for key in ["mean_energy", "mean_energy_sys_err", "mean_spread"]:
+        lower, median, upper = np.quantile(good[key], quantiles)
+        result[key] = {"median": median, "interval": [lower, upper]}
+    return result
@@ -0,0 +1,221 @@
+"""
+Store of the averaged energies of all seasons, points and runs of `eval_mean.py`.
+
+The results are kept in one SQLite table indexed by season, result set,
+energy and version, so comparisons across seasons and dates are queries
+instead of parsing date-stamped JSON files. The JSON files written before
+the store can be imported with
+
+    python -m eval.results_store results/results_Phi2018_18042025.json ...
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from datetime import datetime
+from pathlib import Path
+import json
+import re
+import sqlite3
+import sys
+
+import pandas as pd
+
+RESULT_FIELDS = [
+    "mean_energy",
+    "mean_energy_stat_err",
+    "mean_energy_sys_err",
+    "mean_spread",
+    "mean_spread_stat_err",
+]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS results (
+    season TEXT NOT NULL,
+    point TEXT NOT NULL,
+    energy REAL NOT NULL,
+    result_set TEXT NOT NULL,
+    version TEXT NOT NULL,
+    created TEXT NOT NULL,
+    {", ".join(f"{name} REAL" for name in RESULT_FIELDS)},
+    -- the other fields of the averager, e.g. of the closest Compton estimate
+    extra TEXT,
+    PRIMARY KEY (season, point, result_set, version)
+);
+CREATE INDEX IF NOT EXISTS results_energy ON results (season, result_set, energy);
+CREATE INDEX IF NOT EXISTS results_created
+    ON results (season, result_set, point, created);
+CREATE INDEX IF NOT EXISTS results_version ON results (version);
+"""
+
+
+def split_key(key: str) -> tuple[str, str]:
+    """`<season>_e<point>` key of `eval_mean.py` -> (season, point)."""
+    season, point = key.rsplit("_e", 1)
+    return season, point
+
+
+class ResultsStore:
+    """
+    SQLite table of the averaged energies, one row per
+    (season, point, result set, version)
+    """
+
+    def __init__(self, path: Path):
+        """
+        Parameters
+        ----------
+        path : Path
+            SQLite database, created if it doesn't exist
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def append(
+        self,
+        results: dict[str, dict],
+        result_set: str = "",
+        version: str | None = None,
+        created: datetime | None = None,
+    ) -> int:
+        """Add the results of one result set, replacing those of the same version.
+
+        Parameters
+        ----------
+        results : dict[str, dict]
+            `<season>_e<point>` -> fit results, as returned by the averagers
+        result_set : str
+            name of the result set, e.g. "" or "_delta_E" (see `eval_mean.py`)
+        version : str | None
+            version of the run, the `ddmmyyyy` date of `created` by default
+        created : datetime | None
+            time of the run, now by default; the latest version is the last created
+
+        Returns
+        -------
+        int
+            number of stored rows
+        """
+        created = created or datetime.now()
+        version = version or created.strftime("%d%m%Y")
+        rows = []
+        for key, fit in results.items():
+            season, point = split_key(key)
+            extra = {k: v for k, v in fit.items() if k not in RESULT_FIELDS}
+            rows.append(
+                (
+                    season,
+                    point,
+                    float(point),
+                    result_set,
+                    version,
+                    created.isoformat(),
+                    *(fit.get(name) for name in RESULT_FIELDS),
+                    json.dumps(extra, default=str) if extra else None,
+                )
+            )
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO results VALUES ({', '.join('?' * 12)})", rows
+            )
+        return len(rows)
+
+    def query(
+        self,
+        season: str | None = None,
+        points: list[str] | None = None,
+        energy_range: tuple[float, float] | None = None,
+        result_set: str = "",
+        version: str | None = None,
+    ) -> pd.DataFrame:
+        """Results sorted by season and energy.
+
+        Parameters
+        ----------
+        season : str | None
+            season name, all seasons if None
+        points : list[str] | None
+            energy point names, e.g. ["508.5", "509"], all points if None
+        energy_range : tuple[float, float] | None
+            closed range of the point energies, [MeV]
+        result_set : str
+            name of the result set
+        version : str | None
+            version of the run, the latest result of every point if None
+
+        Returns
+        -------
+        pd.DataFrame
+            one row per point, with the `<season>_e<point>` key as `key` column
+        """
+        conditions, parameters = ["result_set = ?"], [result_set]
+        if season is not None:
+            conditions.append("season = ?")
+            parameters.append(season)
+        if points is not None:
+            conditions.append(f"point IN ({', '.join('?' * len(points))})")
+            parameters += [str(point) for point in points]
+        if energy_range is not None:
+            conditions.append("energy BETWEEN ? AND ?")
+            parameters += [float(energy_range[0]), float(energy_range[1])]
+        if version is not None:
+            conditions.append("version = ?")
+            parameters.append(version)
+        else:
+            conditions.append(
+                "created = (SELECT MAX(created) FROM results AS latest"
+                " WHERE latest.season = results.season"
+                " AND latest.result_set = results.result_set"
+                " AND latest.point = results.point)"
+            )
+        df = pd.read_sql_query(
+            f"SELECT * FROM results WHERE {' AND '.join(conditions)}"
+            " ORDER BY season, energy",
+            self.connection,
+            params=parameters,
+        )
+        df.insert(0, "key", df["season"] + "_e" + df["point"])
+        return df
+
+    def versions(self, season: str | None = None) -> list[str]:
+        """Versions of the runs, the oldest first."""
+        rows = self.connection.execute(
+            "SELECT version FROM results WHERE ? IS NULL OR season = ?"
+            " GROUP BY version ORDER BY MIN(created)",
+            (season, season),
+        )
+        return [version for (version,) in rows]
+
+
+_LEGACY_NAME = re.compile(r"results_(?P<set>.+?)_(?P<date>\d{8})$")
+
+
+def import_json(store: ResultsStore, path: Path) -> int:
+    """Import a `results_<season><result set>_<ddmmyyyy>.json` file of `eval_mean`."""
+    match = _LEGACY_NAME.match(path.stem)
+    if match is None:
+        raise ValueError(f"Unexpected name of the results file: {path.name}")
+    results: dict = json.loads(path.read_text())
+    season = next(iter(results)).rsplit("_e", 1)[0] if results else ""
+    result_set = match.group("set").removeprefix(season)
+    created = datetime.strptime(match.group("date"), "%d%m%Y")
+    return store.append(results, result_set, match.group("date"), created)
+
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+    from config import ROOT_FOLDER
+
+    with ResultsStore(Path(ROOT_FOLDER, "results/results.sqlite")) as store:
+        for name in sys.argv[1:]:
+            print(f"{name}: {import_json(store, Path(name))} rows imported")
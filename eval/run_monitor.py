@@ -0,0 +1,98 @@
+"""
+Mergeable per-run accumulators of an appended `kChargedTree`, for `monitor.py`.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import uproot as up
+
+from boost.accumulators import Histogram, RunningMoments
+from instrumentation import span
+from .kch_energy import ENERGY_BRANCHES, RunGroupEnergies, RunHistograms, fill_chunk
+from .utils import Season, index_compton_tables
+
+n_bins = 1000
+pz_range = (-20, 20)  # MeV, as `boost/driver.py`
+
+
+@dataclass
+class PointMonitor:
+    """Accumulated statistics of the processed entries of one `kChargedTree`."""
+
+    input: Path
+    entries: int = 0
+    # run of the last processed entry, to detect a rewritten tree
+    last_run: int = -1
+    compton_last_run: int = 0
+    hists: RunHistograms = field(default_factory=RunHistograms)
+    tot_pz: Histogram = field(default_factory=lambda: Histogram(n_bins, pz_range))
+    tot_pz_moments: RunningMoments = field(default_factory=RunningMoments)
+    run_tot_pz: dict[int, RunningMoments] = field(default_factory=dict)
+    # the last fitted run groups, only the changed ones are refitted
+    groups: RunGroupEnergies | None = None
+
+    @property
+    def point_name(self) -> str:
+        return self.input.stem.split("_e", 1)[1]
+
+    def update(self) -> np.ndarray | None:
+        """Process the entries appended since the last update.
+
+        Returns
+        -------
+        np.ndarray | None
+            the runs of the new entries, or None if the tree was rewritten
+            and the point has to be rebuilt
+        """
+        with up.open(f"{self.input.as_posix()}:kChargedTree") as tree:  # type: ignore
+            n_entries = tree.num_entries
+            if self.entries > 0:
+                if n_entries < self.entries:
+                    return None
+                last = tree["runnum"].array(
+                    entry_start=self.entries - 1, entry_stop=self.entries, library="np"
+                )
+                if int(last[0]) != self.last_run:
+                    return None
+            if n_entries == self.entries:
+                return np.empty(0, dtype=np.int64)
+            with span("read new entries", "io") as info:
+                arrays = tree.arrays(
+                    [*ENERGY_BRANCHES, "tthv"], entry_start=self.entries, library="ak"
+                )
+                info["events"] = len(arrays)
+
+        with span("update accumulators", "transform", events=len(arrays)):
+            fill_chunk(self.hists, arrays)
+            runnum = ak.to_numpy(arrays["runnum"]).astype(np.int64)
+            p = ak.to_numpy(ak.to_regular(arrays["tptotv"][:, :2], axis=1))
+            theta = ak.to_numpy(ak.to_regular(arrays["tthv"][:, :2], axis=1))
+            tot_pz = (p.astype(np.float64) * np.cos(theta)).sum(axis=1)
+            self.tot_pz.fill(tot_pz)
+            self.tot_pz_moments.fill(tot_pz)
+
+            runs, inverse = np.unique(runnum, return_inverse=True)
+            counts = np.bincount(inverse)
+            means = np.bincount(inverse, weights=tot_pz) / counts
+            m2 = np.bincount(inverse, weights=(tot_pz - means[inverse]) ** 2)
+            for run, count, mean, run_m2 in zip(runs, counts, means, m2):
+                self.run_tot_pz.setdefault(int(run), RunningMoments()).merge(
+                    RunningMoments(int(count), float(mean), float(run_m2))
+                )
+        self.entries = n_entries
+        self.last_run = int(runnum[-1])
+        return runs
+
+
+def compton_last_run(season: Season, point_name: str) -> int:
+    """Last run of the Compton table of the point, 0 if there is none.
+    The table is reread only when its mtime or size changes."""
+    tables = index_compton_tables(season.compton_tables).get(float(point_name), [])
+    if not tables:
+        return 0
+    return tables[0].last_run
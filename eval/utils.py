@@ -6,7 +6,9 @@ Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
 
 import csv
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
+from typing import NamedTuple
 import warnings
 
 
@@ -17,6 +19,60 @@ class Season:
     graphs_location: Path
     compton_tables: Path
     output_tables: Path
+    # Binary cache of parsed Compton tables, disabled if None.
+    cache_location: Path | None = None
+
+
+class ComptonTable(NamedTuple):
+    first_run: int
+    last_run: int
+    path: Path
+
+
+@lru_cache
+def _scan_compton_tables(
+    compton_tables: Path, mtime_ns: int
+) -> dict[float, list[tuple[int, Path]]]:
+    index: dict[float, list[tuple[int, Path]]] = {}
+    for table in compton_tables.iterdir():
+        if not table.is_file() or table.name.startswith("."):
+            continue
+        energy, *rest = table.stem.split("_")
+        first_run = int(rest[0]) if rest else 0
+        index.setdefault(float(energy), []).append((first_run, table))
+    for tables in index.values():
+        tables.sort(reverse=True)
+    return index
+
+
+@lru_cache
+def _table_runs(
+    table: Path, first_run: int, mtime_ns: int, size: int
+) -> tuple[int, int]:
+    """[first, last] run of the rows of a table, `first_run` of its name if empty."""
+    with open(table) as csvfile:
+        rows = [
+            (int(row["run_first"]), int(row["run_last"]))
+            for row in csv.DictReader(csvfile)
+        ]
+    if not rows:
+        return first_run, first_run
+    return min(first for first, _ in rows), max(last for _, last in rows)
+
+
+def index_compton_tables(compton_tables: Path) -> dict[float, list[ComptonTable]]:
+    """Map energy point -> [(first run, last run, table path)], the largest first
+    run (of the file name) first. The directory is scanned once and rescanned
+    only if its content changes, a table is reread only if it changes."""
+    index = {}
+    scan = _scan_compton_tables(compton_tables, compton_tables.stat().st_mtime_ns)
+    for energy, tables in scan.items():
+        index[energy] = []
+        for first_run, table in tables:
+            stat = table.stat()
+            runs = _table_runs(table, first_run, stat.st_mtime_ns, stat.st_size)
+            index[energy].append(ComptonTable(*runs, table))
+    return index
 
 
 def _make_graph_filename(point) -> str:
@@ -41,23 +97,20 @@ class Point:
                 f"There is no {self.graph_location} file for {self.name} from season {self.season.name}."
             )
 
-        table = [
-            table
-            for table in self.season.compton_tables.iterdir()
-            if float(table.stem.split("_")[0]) == float(self.name)
-        ]
-        if not table:
+        tables = index_compton_tables(self.season.compton_tables).get(
+            float(self.name), []
+        )
+        if not tables:
             raise RuntimeError(
                 f"Can't load raw table for energy point {self.name} from season {self.season.name}"
             )
-        if len(table) > 1:
+        if len(tables) > 1:
             warnings.warn(
-                f"There are {len(table)} table for {self.name} from season {self.season.name} found.\
+                f"There are {len(tables)} table for {self.name} from season {self.season.name} found.\
                 Expected 1. The one with the largest run number is taken.",
                 category=RuntimeWarning,
             )
-            table.sort(key=lambda path: int(path.stem.split("_")[1]), reverse=True)
-        self.compton_table = table[0]
+        self.compton_table = tables[0].path
 
         self.output_table = Path(
             self.season.output_tables, f"{self.season.name}_e{self.name}.csv"
@@ -0,0 +1,123 @@
+"""
+Charged kaon energies of run groups for every energy point, the Python
+counterpart of `eval/evaluate_energy.cpp`:
+
+    data/<season>/kpkm_scan*_e*.root
+        -> results/<season>/graphs/graph_scan*_e*.root (grKchEnergy)
+        -> results/<season>/hists/tot_hist_scan*_e*.root
+
+The points are processed in a process pool.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from multiprocessing.pool import Pool
+from pathlib import Path
+import os
+import time
+
+from eval.kch_energy import (
+    evaluate_groups,
+    fill_run_histograms,
+    read_bad_runs,
+    write_graph,
+    write_merged_hist,
+)
+from instrumentation import TRACE_ENV, point_context, span
+from config import ROOT_FOLDER
+
+root_folder = Path(ROOT_FOLDER)
+
+
+def discover_inputs(seasons: list[str]) -> list[tuple[str, Path]]:
+    """Find every `data/<season>/kpkm_scan*_e*.root` file of the given seasons."""
+    inputs = []
+    for season_name in seasons:
+        season_dir = Path(root_folder, f"data/{season_name}")
+        inputs += [
+            (season_name, inp) for inp in sorted(season_dir.glob("kpkm_scan*_e*.root"))
+        ]
+    return inputs
+
+
+def process_point(
+    season_name: str,
+    input: Path,
+    bad_runs: set[int],
+    max_group_size: int = 30,
+    step_size: int | str = "100 MB",
+) -> dict:
+    point_name = input.stem.removeprefix("kpkm_")
+    output_dir = Path(root_folder, f"results/{season_name}")
+    output_graph = Path(output_dir, f"graphs/graph_{point_name}.root")
+    output_hist = Path(output_dir, f"hists/tot_hist_{point_name}.root")
+
+    start = time.time()
+    with point_context(f"{season_name}_{point_name}"):
+        hists = fill_run_histograms(input, bad_runs, step_size=step_size)
+        with span("fit run groups", "fit") as info:
+            groups = evaluate_groups(hists, max_group_size)
+            info["groups"] = len(groups.energies)
+        with span("write graph", "io"):
+            write_graph(output_graph, groups)
+            write_merged_hist(output_hist, hists, point_name)
+    print(f"Output file saved: {output_graph}")
+    return {
+        "point": f"{season_name}_{point_name}",
+        "runs": len(hists.runs),
+        "groups": len(groups.energies),
+        "failed": int((groups.energy_errors == 0).sum()),
+        "wall_time": time.time() - start,
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(
+        description="Evaluate kaon energies of run groups of every energy point."
+    )
+    parser.add_argument("--seasons", nargs="+", default=["Phi2018", "Phi2024"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--bad-runs", type=Path, default=None, help="file of runs to skip"
+    )
+    parser.add_argument("--max-group-size", type=int, default=30)
+    parser.add_argument(
+        "--step-size",
+        type=lambda s: int(s) if s.isdigit() else s,
+        default="100 MB",
+        help='input chunk size, entries or bytes, e.g. 100000 or "100 MB"',
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    bad_runs = read_bad_runs(args.bad_runs) if args.bad_runs is not None else set()
+    inputs = discover_inputs(args.seasons)
+    print(f"Number of points: {len(inputs)}")
+
+    start = time.time()
+    with Pool(min(args.workers, max(len(inputs), 1))) as pool:
+        results = pool.starmap(
+            process_point,
+            [
+                (season_name, input, bad_runs, args.max_group_size, args.step_size)
+                for season_name, input in inputs
+            ],
+        )
+    end = time.time()
+
+    print(f"{'point':<26}{'runs':>8}{'groups':>8}{'failed':>8}{'time, s':>10}")
+    for res in results:
+        print(
+            f"{res['point']:<26}{res['runs']:>8}{res['groups']:>8}"
+            f"{res['failed']:>8}{res['wall_time']:>10.2f}"
+        )
+    print(f"Execution took: {round(end - start, 2)} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 from datetime import datetime
 from eval import prepare_dataframe as prep
 from eval.average import ultimate_averager as avg
-from eval.utils import Season, make_a_point
-from secret import ROOT_FOLDER
+from eval.graphs import Graph, SeasonGraphs, load_season_graphs
+from eval.incremental import ResultCache, settings_hash
+from eval.results_store import ResultsStore
+from eval.utils import Point, Season, make_a_point
+from instrumentation import TRACE_ENV, point_context, span
+from config import ROOT_FOLDER
 
+from argparse import ArgumentParser
+from itertools import product
+from multiprocessing.pool import Pool
 from pathlib import Path
 import json
+import os
 from datetime import datetime
 from tqdm import tqdm
 
@@ -20,6 +28,7 @@ phi2018 = Season(
     graphs_location=Path(root_folder, "results/Phi2018/graphs"),
     compton_tables=Path(root_folder, "tables/Compton/energy_points/RHO2018"),
     output_tables=Path(root_folder, "tables/k_charged/RHO2018"),
+    cache_location=Path(root_folder, "cache/compton/RHO2018"),
 )
 
 phi2024 = Season(
@@ -28,29 +37,166 @@ phi2024 = Season(
     graphs_location=Path(root_folder, "results/Phi2024/graphs"),
     compton_tables=Path(root_folder, "tables/Compton/energy_points/PHI2024"),
     output_tables=Path(root_folder, "tables/k_charged/PHI2024"),
+    cache_location=Path(root_folder, "cache/compton/PHI2024"),
 )
 
-if __name__ == "__main__":
+
+# result set name -> averaged column
+result_sets = {"": "e_mean", "_delta_E": "delta_e"}
+# cached results are reused only for the same result sets and averaging code
+settings = settings_hash(
+    result_sets,
+    [
+        Path(Path(__file__).parent, "eval/average.py"),
+        Path(Path(__file__).parent, "eval/prepare_dataframe.py"),
+        Path(Path(__file__).parent, "eval/graphs.py"),
+        Path(Path(__file__).parent, "eval/utils.py"),
+    ],
+)
+
+
+def point_key(point: Point) -> str:
+    return f"{point.season.name}_e{point.name}"
+
+
+def evaluate_point(
+    point: Point, graph: Graph | None = None, start: dict | None = None
+) -> tuple[str, dict]:
+    """Fit all result sets of the point from one cleaned dataframe.
+    The fits start from the `start` results of the point, if any."""
+    start = start or {}
+    key = point_key(point)
+    with point_context(key):
+        df = prep.retrieve_raw_table(point)
+        df = prep.add_energies(point, df, graph)
+        with span("write output table", "io"):
+            df.to_csv(point.output_table, na_rep="None", index=False)
+        df = df.dropna()
+        return key, {
+            set_name: avg(df, e_mean_key=column, start=start.get(set_name))
+            for set_name, column in result_sets.items()
+        }
+
+
+def _evaluate_task(task: tuple[Point, Graph, dict | None]) -> tuple[str, dict]:
+    return evaluate_point(*task)
+
+
+def evaluate_points(
+    points: list[Point], jobs: int = 1, cache: ResultCache | None = None
+) -> dict[str, dict]:
+    """Evaluate points, in a process pool if `jobs` > 1.
+    The workers are forked after the heavy imports, so they are paid once.
+    With a `cache`, only the points with changed inputs are evaluated,
+    starting from their previous results."""
+    results: dict[str, dict] = {}
+    todo = points
+    if cache is not None:
+        todo = []
+        for point in points:
+            cached = cache.get(point_key(point), point, settings)
+            if cached is None:
+                todo.append(point)
+            else:
+                results[point_key(point)] = cached
+        print(f"Up to date points: {len(results)}, to evaluate: {len(todo)}")
+
+    # graphs of a season are loaded at once, from the memory-mapped cache if any
+    graphs: dict[str, SeasonGraphs] = {}
+    for season in {point.season.name: point.season for point in todo}.values():
+        graphs_cache = None
+        if season.cache_location is not None:
+            graphs_cache = Path(season.cache_location, "graphs")
+        season_points = [point for point in points if point.season is season]
+        graphs[season.name] = load_season_graphs(season_points, graphs_cache)
+    tasks = [
+        (
+            point,
+            graphs[point.season.name][point.name],
+            None if cache is None else cache.previous(point_key(point)),
+        )
+        for point in todo
+    ]
+
+    if jobs > 1 and len(todo) > 1:
+        # iminuit is imported lazily by the averager, the workers inherit it
+        import iminuit  # noqa: F401
+
+        with Pool(min(jobs, len(todo))) as pool:
+            new_results = dict(
+                tqdm(pool.imap_unordered(_evaluate_task, tasks), total=len(todo))
+            )
+    else:
+        new_results = dict(_evaluate_task(task) for task in tqdm(tasks))
+    results |= new_results
+
+    if cache is not None and new_results:
+        for point in todo:
+            cache.put(point_key(point), point, settings, new_results[point_key(point)])
+        cache.save()
+    return {
+        k: results[k] for k in sorted(results, key=lambda x: float(x.split("_e")[1]))
+    }
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(description="Average energies of all energy points.")
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="number of worker processes"
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="refit only the points whose inputs changed since the last run",
+    )
+    parser.add_argument(
+        "--cache", type=Path, default=Path(root_folder, "cache/eval_mean.json")
+    )
+    parser.add_argument(
+        "--store", type=Path, default=Path(root_folder, "results/results.sqlite")
+    )
+    parser.add_argument(
+        "--version", default=None, help="version of the run, today's date by default"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="also write the date-stamped JSON files"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
     points2018 = make_a_point(phi2018)
     points2024 = make_a_point(phi2024)
     points_dict = {"Phi2018": points2018, "Phi2024": points2024}
-    for set_name, points in points_dict.items():
-        results = {}
-        print(f"Processing {set_name}...")
-        for point in tqdm(points):
-            df = prep.retrieve_raw_table(point)
-            df = prep.add_energies(point, df)
-            df.to_csv(point.output_table, na_rep="None", index=False)
-            results[f"{point.season.name}_e{point.name}"] = avg(df.dropna())
-            results[f"{point.season.name}_e{point.name}"] = avg(
-                df.dropna(), e_mean_key="delta_e"
+    print(f"Processing {', '.join(points_dict)}...")
+    cache = ResultCache(args.cache) if args.incremental else None
+    all_results = evaluate_points(points2018 + points2024, args.jobs, cache)
+    with ResultsStore(args.store) as store:
+        for result_set in result_sets:
+            store.append(
+                {k: v[result_set] for k, v in all_results.items()},
+                result_set,
+                args.version,
             )
-        _results_path = results_path.with_stem(
-            results_path.stem.replace("result", f"results_{set_name}_delta_E")
-        )
+    print(f"Results stored: {args.store}")
+    if not args.json:
+        return
+    for season_name, result_set in product(points_dict, result_sets):
         results = {
-            k: results[k]
-            for k in sorted(results, key=lambda x: float(x.split("_e")[1]))
+            k: v[result_set]
+            for k, v in all_results.items()
+            if k.startswith(f"{season_name}_e")
         }
+        _results_path = results_path.with_stem(
+            results_path.stem.replace("result", f"results_{season_name}{result_set}")
+        )
         with open(_results_path, "w+") as file:
             json.dump(results, file, indent=4)
+        print(f"Results saved: {_results_path}")
+
+
+if __name__ == "__main__":
+    main()
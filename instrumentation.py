@@ -0,0 +1,123 @@
+"""
+Opt-in instrumentation of the pipeline stages.
+
+Set the `BEAMENERGY_TRACE` environment variable to a file path to record
+every instrumented span (wall time, category, energy point, peak RSS and
+extra counters like Minuit calls) as a JSON line. Worker processes inherit
+the variable and append to the same file. Without it, spans cost nothing.
+
+Categories: "io" (ROOT/CSV reading and writing), "transform" (array and
+DataFrame processing), "fit" (Minuit migrad/hesse), "plot" (rendering).
+
+Run `python instrumentation.py <trace> [--csv <output>]` for a summary.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from pathlib import Path
+import csv
+import json
+import os
+import resource
+import sys
+import time
+
+TRACE_ENV = "BEAMENERGY_TRACE"
+_context: dict[str, str] = {}
+
+
+def trace_path() -> Path | None:
+    path = os.environ.get(TRACE_ENV)
+    return Path(path) if path else None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the process, [MB]."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+@contextmanager
+def point_context(point: str):
+    """Attribute the spans inside to the energy point."""
+    previous = _context.get("point")
+    _context["point"] = point
+    try:
+        yield
+    finally:
+        if previous is None:
+            _context.pop("point")
+        else:
+            _context["point"] = previous
+
+
+@contextmanager
+def span(stage: str, category: str, **fields):
+    """Record the wall time of the block; counters can be added to the yielded dict."""
+    path = trace_path()
+    extra: dict = {}
+    if path is None:
+        yield extra
+        return
+    start = time.time()
+    begin = time.perf_counter()
+    try:
+        yield extra
+    finally:
+        record = {
+            "stage": stage,
+            "category": category,
+            "point": _context.get("point"),
+            "pid": os.getpid(),
+            "start": round(start, 6),
+            "seconds": round(time.perf_counter() - begin, 6),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            **fields,
+            **extra,
+        }
+        with open(path, "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+
+def read_trace(path: Path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines() if line]
+
+
+def export_csv(records: list[dict], output: Path):
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    with open(output, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def summarize(records: list[dict]) -> dict[tuple[str, str], dict]:
+    """Total time, number of spans and max peak RSS per (point, category)."""
+    summary: dict[tuple[str, str], dict] = {}
+    for record in records:
+        key = (record.get("point") or "-", record["category"])
+        entry = summary.setdefault(key, {"seconds": 0.0, "spans": 0, "peak_rss_mb": 0})
+        entry["seconds"] += record["seconds"]
+        entry["spans"] += 1
+        entry["peak_rss_mb"] = max(entry["peak_rss_mb"], record["peak_rss_mb"])
+    return summary
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Summarize a pipeline trace.")
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("--csv", type=Path, default=None, help="export as CSV")
+    args = parser.parse_args()
+
+    records = read_trace(args.trace)
+    print(f"{'point':<22}{'category':<12}{'spans':>8}{'time, s':>12}{'RSS, MB':>10}")
+    for (point, category), entry in sorted(summarize(records).items()):
+        print(
+            f"{point:<22}{category:<12}{entry['spans']:>8}"
+            f"{entry['seconds']:>12.3f}{entry['peak_rss_mb']:>10.1f}"
+        )
+    if args.csv is not None:
+        export_csv(records, args.csv)
+        print(f"Output file saved: {args.csv}")
@@ -0,0 +1,176 @@
+"""
+Run-by-run monitoring of the beam energy during data taking:
+
+    python monitor.py --season Phi2024 [--interval 60] [--once]
+
+The `data/<season>/kpkm_scan*_e*.root` files are polled, and only the entries
+appended since the last poll are read. Their runs update mergeable per-run
+accumulators: the kaon energy histograms and the tot_pz moments and histogram.
+A point is refitted only if its tree got new runs or its Compton table got
+new rows: its `grKchEnergy` graph is rewritten from the accumulated
+histograms, refitting only the run groups with new runs, and its energy is
+averaged and appended to the results store.
+
+If a tree was rewritten with a different beginning, its point is rebuilt.
+The accumulators are kept in `cache/monitor/<season>.pkl` between restarts.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+import csv
+import os
+import pickle
+import time
+
+import numpy as np
+
+from eval.kch_energy import evaluate_groups, write_graph
+from eval.results_store import ResultsStore
+from eval.run_monitor import PointMonitor, compton_last_run
+from eval.utils import Point, Season
+from instrumentation import TRACE_ENV, point_context, span
+from config import ROOT_FOLDER
+
+root_folder = Path(ROOT_FOLDER)
+
+
+def make_point(season: Season, point_name: str) -> Point | None:
+    """The point of the season info table, None if it isn't there."""
+    with open(season.season_info) as csvfile:
+        for row in csv.DictReader(csvfile):
+            if float(row["energy_point"]) == float(point_name):
+                return Point(season, row["energy_point"], float(row["mean_energy"]))
+    return None
+
+
+def refit_point(
+    season: Season,
+    monitor: PointMonitor,
+    new_runs: np.ndarray,
+    max_group_size: int = 30,
+) -> dict | None:
+    """Rewrite the graph of the point and average its energy, if it's in the
+    season info table and has a Compton table. Only the run groups with
+    `new_runs` are refitted."""
+    with span("fit run groups", "fit") as info:
+        groups = evaluate_groups(
+            monitor.hists,
+            max_group_size,
+            previous=monitor.groups,
+            changed_runs=new_runs,
+        )
+        info["groups"] = len(groups.first_runs)
+    monitor.groups = groups
+    graph_location = Path(
+        season.graphs_location, f"graph_{monitor.input.stem.removeprefix('kpkm_')}.root"
+    )
+    with span("write graph", "io"):
+        write_graph(graph_location, groups)
+    if monitor.compton_last_run == 0:
+        return None
+    point = make_point(season, monitor.point_name)
+    if point is None:
+        return None
+    from eval_mean import evaluate_point
+
+    return evaluate_point(point)[1]
+
+
+def poll(
+    season: Season,
+    monitors: dict[str, PointMonitor],
+    store: ResultsStore | None = None,
+    max_group_size: int = 30,
+) -> list[dict]:
+    """Process the new runs of every point of the season, refit the updated points."""
+    updates = []
+    inputs = sorted(Path(root_folder, f"data/{season.name}").glob("kpkm_scan*_e*.root"))
+    for input in inputs:
+        monitor = monitors.setdefault(input.name, PointMonitor(input))
+        key = f"{season.name}_e{monitor.point_name}"
+        start = time.time()
+        with point_context(key):
+            new_runs = monitor.update()
+            if new_runs is None:
+                print(f"{input.name} was rewritten, rebuilding {key}")
+                monitor = monitors[input.name] = PointMonitor(input)
+                new_runs = monitor.update()
+            last_run = compton_last_run(season, monitor.point_name)
+            if len(new_runs) == 0 and last_run == monitor.compton_last_run:
+                continue
+            monitor.compton_last_run = last_run
+            results = refit_point(season, monitor, new_runs, max_group_size)
+        if results is not None and store is not None:
+            for result_set, fit in results.items():
+                store.append({key: fit}, result_set)
+        updates.append(
+            {
+                "point": key,
+                "new_runs": len(new_runs),
+                "entries": monitor.entries,
+                "tot_pz_mean": monitor.tot_pz_moments.mean,
+                "mean_energy": None if results is None else results[""]["mean_energy"],
+                "wall_time": time.time() - start,
+            }
+        )
+    return updates
+
+
+def load_monitors(state: Path) -> dict[str, PointMonitor]:
+    if not state.exists():
+        return {}
+    with open(state, "rb") as file:
+        return pickle.load(file)
+
+
+def save_monitors(state: Path, monitors: dict[str, PointMonitor]):
+    state.parent.mkdir(parents=True, exist_ok=True)
+    with open(state.with_suffix(".tmp"), "wb") as file:
+        pickle.dump(monitors, file)
+    os.replace(state.with_suffix(".tmp"), state)
+
+
+def main(argv: list[str] | None = None):
+    from eval_mean import phi2018, phi2024
+
+    seasons = {season.name: season for season in [phi2018, phi2024]}
+    parser = ArgumentParser(description="Monitor the beam energy run by run.")
+    parser.add_argument("--season", choices=list(seasons), default="Phi2024")
+    parser.add_argument("--interval", type=float, default=60, help="seconds")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    parser.add_argument("--max-group-size", type=int, default=30)
+    parser.add_argument("--state", type=Path, default=None)
+    parser.add_argument(
+        "--store", type=Path, default=Path(root_folder, "results/results.sqlite")
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    season = seasons[args.season]
+    state = args.state or Path(root_folder, f"cache/monitor/{season.name}.pkl")
+    monitors = load_monitors(state)
+    with ResultsStore(args.store) as store:
+        while True:
+            for update in poll(season, monitors, store, args.max_group_size):
+                energy = update["mean_energy"]
+                print(
+                    f"{update['point']:<16}{update['new_runs']:>6} new runs"
+                    f"{update['entries']:>10} events"
+                    f"  tot_pz {update['tot_pz_mean']:.4f} MeV"
+                    f"  energy {'-' if energy is None else f'{energy:.4f}'} MeV"
+                    f"  {update['wall_time']:.2f} s"
+                )
+            save_monitors(state, monitors)
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
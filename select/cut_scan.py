@@ -0,0 +1,250 @@
+"""
+Systematic scan of the K+K- selection cuts in a single pass over the input.
+
+Every chunk of the `tr_ph` tree is read once and a grid of cut sets is
+evaluated over the same arrays as vectorized masks, so N variations cost
+one I/O pass instead of N runs of `select_driver.py`:
+
+    python cut_scan.py --grid chi2r=10,15,20 --grid mom_balance=0.2,0.3
+
+Per variation the number of selected events and the running moments of the
+total pz and of the kaon energies are saved to `cut_scan/cut_scan_<point>.json`.
+With `--bitmask` the `cutScan` tree of `cut_scan/cut_scan_<point>.root` keeps
+the events passing any variation, bit k of `passed_<k // 64>` is variation k.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, field, fields
+from itertools import count, product
+from multiprocessing.pool import Pool
+from pathlib import Path
+import json
+import os
+import sys
+import time
+
+import awkward as ak
+import numpy as np
+import uproot as up
+
+from selection import Cuts, event_mask, read_branches, two_track_arrays
+
+sys.path.append(str(Path(__file__).parent.parent))
+from boost.accumulators import RunningMoments
+from instrumentation import TRACE_ENV, point_context, span
+
+KAON_MASS = 493.677  # MeV
+
+
+def cut_grid(variations: dict[str, list]) -> list[Cuts]:
+    """Cartesian product of the cut values, the other cuts keep their defaults."""
+    return [
+        Cuts(**dict(zip(variations, values)))
+        for values in product(*variations.values())
+    ]
+
+
+def parse_grid(specs: list[str]) -> dict[str, list]:
+    """Parse `name=v1,v2,...` specs into cut values of the `Cuts` field types."""
+    types = {cut.name: type(getattr(Cuts(), cut.name)) for cut in fields(Cuts)}
+    variations = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in types:
+            raise ValueError(
+                f"Unknown cut {name!r}, expected one of {', '.join(types)}"
+            )
+        variations[name] = [types[name](value) for value in values.split(",")]
+    return variations
+
+
+@dataclass
+class VariationSummary:
+    """Selected events of one cut set."""
+
+    cuts: Cuts
+    n_selected: int = 0
+    tot_pz: RunningMoments = field(default_factory=RunningMoments)
+    energy: RunningMoments = field(default_factory=RunningMoments)
+
+    def fill(self, mask: np.ndarray, tot_pz: np.ndarray, energies: np.ndarray):
+        self.n_selected += int(mask.sum())
+        self.tot_pz.fill(tot_pz[mask])
+        self.energy.fill(energies[mask].ravel())
+
+    def to_dict(self) -> dict:
+        return {
+            "cuts": asdict(self.cuts),
+            "n_selected": self.n_selected,
+            "tot_pz_mean": self.tot_pz.mean,
+            "tot_pz_std": self.tot_pz.std,
+            "energy_mean": self.energy.mean,
+            "energy_std": self.energy.std,
+        }
+
+
+def scan_cuts(
+    input: str,
+    grid: list[Cuts],
+    step_size: int | str = "100 MB",
+    bitmask_output: Path | None = None,
+) -> tuple[int, list[VariationSummary]]:
+    """Evaluate every cut set of the grid in one pass over the `tr_ph` tree.
+
+    Parameters
+    ----------
+    input : str
+        path or URL of the file with `tr_ph` tree
+    grid : list[Cuts]
+        cut sets to evaluate, see `cut_grid`
+    step_size : int | str
+        chunk size for `uproot.iterate`
+    bitmask_output : Path | None
+        if given, write the `cutScan` tree of the events passing any cut set:
+        their `tr_ph` entry, `runnum`, `tot_pz` and `passed_<word>` bitmasks
+
+    Returns
+    -------
+    tuple[int, list[VariationSummary]]
+        number of events in the input tree and the summaries of the cut sets
+    """
+    n_entries = 0
+    summaries = [VariationSummary(cuts) for cuts in grid]
+    n_words = (len(grid) + 63) // 64
+    file = None if bitmask_output is None else up.recreate(bitmask_output)
+    is_created = False
+
+    chunks = up.iterate(
+        {input: "tr_ph"}, read_branches(), step_size=step_size, library="ak"
+    )
+    for chunk in count():
+        with span("read tr_ph", "io", chunk=chunk) as info:
+            arrays = next(chunks, None)
+            info["events"] = 0 if arrays is None else len(arrays)
+        if arrays is None:
+            break
+        with span("cut scan", "transform", chunk=chunk, variations=len(grid)):
+            tracks = two_track_arrays(arrays)
+            # shared by all the variations, tot_pz and energies don't depend
+            # on the order of the tracks
+            p = tracks["tptotv"].astype(np.float64)
+            tot_pz = (p * np.cos(tracks["tthv"].astype(np.float64))).sum(axis=1)
+            energies = np.sqrt(p**2 + KAON_MASS**2)
+            words = np.zeros((n_words, len(p)), dtype=np.uint64)
+            for k, summary in enumerate(summaries):
+                mask = event_mask(tracks, summary.cuts)
+                summary.fill(mask, tot_pz, energies)
+                words[k // 64] |= mask.astype(np.uint64) << np.uint64(k % 64)
+        if file is not None:
+            with span("write cutScan", "io", chunk=chunk):
+                passed = words.any(axis=0)
+                entries = np.flatnonzero(ak.to_numpy(arrays["nt"] == 2))
+                columns = {
+                    "entry": (entries + n_entries)[passed],
+                    "runnum": tracks["runnum"][passed],
+                    "tot_pz": tot_pz[passed],
+                    **{f"passed_{i}": word[passed] for i, word in enumerate(words)},
+                }
+                if is_created:
+                    file["cutScan"].extend(columns)
+                else:
+                    file.mktree("cutScan", columns)
+                    is_created = True
+        n_entries += len(arrays)
+
+    if file is not None:
+        file.close()
+    return n_entries, summaries
+
+
+def output_name(input: str) -> str:
+    from select_driver import prep_output
+
+    name = prep_output(input)
+    if name == "error":
+        # not a scan file name, e.g. a local test file
+        return f"cut_scan_{Path(input).stem}.root"
+    return name.replace("kpkm_", "cut_scan_")
+
+
+def process_input(
+    input: str,
+    grid: list[Cuts],
+    output_dir: Path,
+    step_size: int | str = "100 MB",
+    bitmask: bool = False,
+) -> dict:
+    name = output_name(input)
+    output = Path(output_dir, name).with_suffix(".json")
+    bitmask_output = output.with_suffix(".root") if bitmask else None
+
+    start = time.time()
+    with point_context(Path(name).stem.removeprefix("cut_scan_")):
+        n_entries, summaries = scan_cuts(input, grid, step_size, bitmask_output)
+    output.write_text(
+        json.dumps(
+            {
+                "input": input,
+                "n_entries": n_entries,
+                "variations": [summary.to_dict() for summary in summaries],
+            },
+            indent=4,
+        )
+    )
+    print(f"Output file saved: {output}")
+    return {"input": input, "n_entries": n_entries, "wall_time": time.time() - start}
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(description="Scan a grid of K+K- selection cuts.")
+    parser.add_argument(
+        "--grid",
+        action="append",
+        default=[],
+        metavar="CUT=V1,V2,...",
+        help="values of a `selection.Cuts` field, the grid is their product",
+    )
+    parser.add_argument(
+        "--inputs", nargs="+", default=None, help="tr_ph files, all points by default"
+    )
+    parser.add_argument("--output-dir", type=Path, default=Path("cut_scan"))
+    parser.add_argument("--bitmask", action="store_true", help="write cutScan trees")
+    parser.add_argument(
+        "--step-size",
+        type=lambda s: int(s) if s.isdigit() else s,
+        default="100 MB",
+        help='input chunk size, entries or bytes, e.g. 100000 or "100 MB"',
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    if args.inputs is None:
+        from select_driver import Phi2018, Phi2024
+
+        args.inputs = Phi2024 + Phi2018
+    grid = cut_grid(parse_grid(args.grid))
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    print(f"Number of inputs: {len(args.inputs)}, cut sets: {len(grid)}")
+
+    start = time.time()
+    with Pool(min(args.workers, len(args.inputs))) as pool:
+        pool.starmap(
+            process_input,
+            [
+                (inp, grid, args.output_dir, args.step_size, args.bitmask)
+                for inp in args.inputs
+            ],
+        )
+    end = time.time()
+    print(f"exec time: {round(end - start, 3)} s or {round((end - start)/60, 2)} min")
+
+
+if __name__ == "__main__":
+    main()
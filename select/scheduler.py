@@ -0,0 +1,177 @@
+"""
+Resumable scheduler of the selection tasks with a JSON manifest.
+
+A task is skipped if its output exists and was produced from the same input
+by the same selection (cut definitions and code). A remote input is the same
+if its ROOT file header (UUID, end, modification time) is; `--force` reruns
+up to date tasks anyway. The manifest keeps status, return code, event counts
+and timing of every task, so a rerun after a crash processes only the missing
+points.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from hashlib import sha256
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Callable
+import json
+import os
+import time
+import traceback
+
+
+@dataclass(frozen=True)
+class Task:
+    input: str
+    output: str
+
+
+def input_identity(input: str) -> str:
+    """Local files are identified by path, size and mtime. Remote ones by URL
+    and the UUID, end and modification time of the ROOT file header, so a
+    re-produced file is stale; the URL alone if the file can't be opened."""
+    path = Path(input)
+    if path.exists():
+        stat = path.stat()
+        return f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    import uproot as up
+
+    try:
+        with up.open(input) as file:  # type: ignore
+            header = file.file
+            modified = header.root_directory.fDatimeM
+            return f"{input}:{header.uuid}:{header.fEND}:{modified}"
+    except Exception as error:
+        print(f"Can't open {input} to check if it changed: {error}")
+        return input
+
+
+def selection_hash(cuts: object, sources: list[Path]) -> str:
+    """Hash of the cut definitions and of the selection code."""
+    digest = sha256(repr(cuts).encode())
+    for source in sources:
+        digest.update(source.read_bytes())
+    return digest.hexdigest()
+
+
+def fingerprint(task: Task, selection: str) -> str:
+    return sha256(f"{input_identity(task.input)}|{selection}".encode()).hexdigest()
+
+
+def pool_size(n_tasks: int, memory_per_task: float = 2**30) -> int:
+    """Number of workers limited by cores, available memory and tasks."""
+    if hasattr(os, "sched_getaffinity"):
+        n_cores = len(os.sched_getaffinity(0))
+    else:
+        n_cores = os.cpu_count() or 1
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        n_memory = max(int(available // memory_per_task), 1)
+    except (ValueError, OSError, AttributeError):
+        n_memory = n_cores
+    return max(min(n_cores, n_memory, n_tasks), 1)
+
+
+def _run_task(
+    engine: Callable[[str, str], dict], task: Task, retries: int
+) -> tuple[Task, dict]:
+    record: dict = {"input": task.input, "attempts": 0}
+    start = time.time()
+    for attempt in range(1, retries + 2):
+        record["attempts"] = attempt
+        try:
+            record.update(engine(task.input, task.output))
+        except Exception:
+            record.update(returncode=-1, error=traceback.format_exc(limit=3))
+        if record.get("returncode") == 0:
+            record.pop("error", None)
+            break
+    record["status"] = "done" if record.get("returncode") == 0 else "failed"
+    record["wall_time"] = round(time.time() - start, 3)
+    record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    return task, record
+
+
+def load_manifest(manifest: Path) -> dict:
+    return json.loads(manifest.read_text()) if manifest.exists() else {}
+
+
+def run_tasks(
+    tasks: list[Task],
+    engine: Callable[[str, str], dict],
+    selection: str,
+    manifest: Path,
+    workers: int | None = None,
+    retries: int = 2,
+    force: bool = False,
+) -> dict:
+    """Run the tasks that are not up to date and update the manifest.
+
+    Parameters
+    ----------
+    tasks : list[Task]
+        selection tasks
+    engine : Callable[[str, str], dict]
+        picklable function (input, output) -> {"returncode", "n_entries", ...}
+    selection : str
+        hash of the cut definitions and of the selection code, see `selection_hash`
+    manifest : Path
+        JSON manifest, updated after every finished task
+    workers : int | None
+        number of workers, by default see `pool_size`
+    retries : int
+        number of retries of a failed task
+    force : bool
+        rerun up to date tasks too
+
+    Returns
+    -------
+    dict
+        the manifest
+    """
+    records = load_manifest(manifest)
+    # remote inputs are opened to be identified, once per task
+    fingerprints = {task: fingerprint(task, selection) for task in tasks}
+    todo = []
+    for task in tasks:
+        record = records.get(task.output, {})
+        is_up_to_date = (
+            record.get("status") == "done"
+            and record.get("fingerprint") == fingerprints[task]
+            and Path(task.output).exists()
+        )
+        if force or not is_up_to_date:
+            todo.append(task)
+    print(f"Number of tasks: {len(tasks)}, up to date: {len(tasks) - len(todo)}")
+    if not todo:
+        return records
+
+    workers = workers or pool_size(len(todo))
+    print(f"Running {len(todo)} tasks with {workers} workers")
+    with Pool(workers) as pool:
+        for task, record in pool.imap_unordered(
+            _star_run_task, [(engine, task, retries) for task in todo]
+        ):
+            record["fingerprint"] = fingerprints[task]
+            records[task.output] = record
+            manifest.write_text(json.dumps(records, indent=4))
+            print(
+                f"[{task.input} -> {task.output}] {record['status']}"
+                f" (code {record.get('returncode')}, attempts {record['attempts']},"
+                f" {record.get('n_selected')}/{record.get('n_entries')} selected,"
+                f" {record['wall_time']} s)",
+                flush=True,
+            )
+    return records
+
+
+def _star_run_task(args: tuple) -> tuple[Task, dict]:
+    return _run_task(*args)
+
+
+def summary(records: dict) -> dict[str, int]:
+    statuses = [record["status"] for record in records.values()]
+    return {status: statuses.count(status) for status in sorted(set(statuses))}
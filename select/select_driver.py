@@ -4,9 +4,24 @@ Driver code for selection of  K^{pm} from e^{+}e^{-} -> K^{+}K^{-} process
 Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
 """
 
+from argparse import ArgumentParser
+from dataclasses import replace
+from functools import partial
+from pathlib import Path
 import subprocess as sub
-from multiprocessing.pool import Pool
+import os
 import re
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from scheduler import Task, run_tasks, selection_hash, summary
+
+sys.path.append(str(Path(__file__).parent.parent))
+from instrumentation import TRACE_ENV, point_context
+
+if TYPE_CHECKING:
+    from selection import OutputSchema
 
 Phi2024 = [
     "root://cmd//scan2024_phi/scan2024_phi_tr_ph_fc_e500_0_v9.root",
@@ -57,32 +72,133 @@ def prep_output(input: str) -> str:
         return "error"
 
 
-def execute_selection(input_file: str, output_name: str):
+def execute_root_selection(input_file: str, output_name: str) -> dict:
+    # the macro runs in this directory, the output stays relative to the caller
+    output_name = str(Path(output_name).resolve())
     aux1, aux2 = '"', "\\"
     command = f'root -l -q "select.cpp(\\{aux1 + "kpkmExp.cpp" + aux2}", \
                 \\{aux1 + "kpkmExp" + aux2}",\
                 \\{aux1 + input_file + aux2}", \
                 \\{aux1 + output_name + aux2}")"'
-    res = sub.run(command, capture_output=True, shell=True)
-    output = res.stderr if res.stderr else res.stdout
-    print(
-        f"[{input_file} tr_ph processing exited with {res.returncode}]",
-        flush=True,
-    )
-    print(output.decode()[118:], flush=True)
+    res = sub.run(command, capture_output=True, shell=True, cwd=Path(__file__).parent)
+    stdout = res.stdout.decode()
+    # the counters are printed as doubles, e.g. 1.23457e+06
+    n_entries = re.search(r"Number of events in the tree = ([\d.e+]+)", stdout)
+    n_selected = re.search(r"N Selected events = ([\d.e+]+)", stdout)
+    record = {
+        "returncode": res.returncode,
+        "n_entries": int(float(n_entries.group(1))) if n_entries else None,
+        "n_selected": int(float(n_selected.group(1))) if n_selected else None,
+    }
+    if res.returncode != 0 or n_selected is None:
+        record["returncode"] = res.returncode or 1
+        record["error"] = res.stderr.decode()[-2000:]
+    return record
 
 
-############# Driver code #############
-if __name__ == "__main__":
-    params = [(inp, prep_output(inp)) for inp in Phi2024]
-    params += [(inp, prep_output(inp)) for inp in Phi2018]
+def execute_python_selection(
+    input_file: str, output_name: str, schema: "OutputSchema | None" = None
+) -> dict:
+    # uproot and awkward are imported by the workers of the python engine only
+    from selection import SCHEMAS, select_events
+
+    with point_context(Path(output_name).stem.removeprefix("kpkm_")):
+        n_entries, n_selected = select_events(
+            input_file, Path(output_name), schema=schema or SCHEMAS["full"]
+        )
+    return {"returncode": 0, "n_entries": n_entries, "n_selected": n_selected}
 
-    import time
+
+engines = {"root": execute_root_selection, "python": execute_python_selection}
+engine_sources = {
+    "root": ["kpkmExp.cpp", "kpkmExp.hpp", "select.cpp"],
+    "python": ["selection.py"],
+}
+
+
+def main(argv: list[str] | None = None):
+    parser = ArgumentParser(description="Select K+K- events of all energy points.")
+    parser.add_argument(
+        "--engine",
+        choices=list(engines),
+        default="root",
+        help="the python engine's output is read by eval_energy.py only, "
+        "not by evaluate_energy.cpp",
+    )
+    parser.add_argument(
+        "--schema",
+        choices=["full", "compact"],
+        default="full",
+        help="output schema of the python engine, see `selection.SCHEMAS`",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["zlib", "lzma", "lz4", "zstd"],
+        default=None,
+        help="compression algorithm, overrides the one of the schema",
+    )
+    parser.add_argument(
+        "--compression-level",
+        type=int,
+        default=None,
+        help="compression level, overrides the one of the schema",
+    )
+    parser.add_argument(
+        "--branches",
+        default=None,
+        help="comma-separated output branches, e.g. emeas,runnum,tptotv",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--force", action="store_true", help="rerun up to date tasks")
+    parser.add_argument(
+        "--manifest", type=Path, default=Path("selection_manifest.json")
+    )
+    parser.add_argument(
+        "--trace", type=Path, default=None, help="per-stage timings (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+    if args.trace is not None:
+        os.environ[TRACE_ENV] = str(args.trace.resolve())
+
+    tasks = [Task(inp, prep_output(inp)) for inp in Phi2024]
+    tasks += [Task(inp, prep_output(inp)) for inp in Phi2018]
+    sources = [Path(Path(__file__).parent, src) for src in engine_sources[args.engine]]
+    if args.engine == "python":
+        from selection import SCHEMAS, Cuts
+
+        schema = SCHEMAS[args.schema]
+        if args.compression is not None:
+            schema = replace(schema, compression=args.compression)
+        if args.compression_level is not None:
+            schema = replace(schema, compression_level=args.compression_level)
+        if args.branches is not None:
+            try:
+                schema = schema.with_branches(args.branches.split(","))
+            except ValueError as error:
+                parser.error(str(error))
+        engine = partial(execute_python_selection, schema=schema)
+        selection = selection_hash((Cuts(), schema), sources)
+    else:
+        engine = engines[args.engine]
+        selection = selection_hash("kpkmExp::Loop", sources)
 
     start = time.time()
-    print(f"Number of tasks: {len(params)}")
     print("Selection started")
-    with Pool(17) as pool:
-        pool.starmap(execute_selection, params)
+    records = run_tasks(
+        tasks,
+        engine,
+        selection,
+        args.manifest,
+        workers=args.workers,
+        retries=args.retries,
+        force=args.force,
+    )
     end = time.time()
+    print(f"Tasks status: {summary(records)}, manifest: {args.manifest}")
     print(f"exec time: {round(end - start, 3)} s or {round((end - start)/60, 2)} min")
+
+
+############# Driver code #############
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Columnar selection of K^{pm} from e^{+}e^{-} -> K^{+}K^{-} process,
+a port of `kpkmExp::Loop` that reads only the needed branches with uproot.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from dataclasses import dataclass, replace
+from itertools import count
+from pathlib import Path
+import sys
+
+import awkward as ak
+import numpy as np
+import uproot as up
+
+sys.path.append(str(Path(__file__).parent.parent))
+from instrumentation import span
+
+
+@dataclass(frozen=True)
+class Cuts:
+    """Selection cuts, the defaults are the ones of `kpkmExp::Loop`."""
+
+    chi2r: float = 15.0
+    chi2z: float = 10.0
+    nhit_min: int = 10
+    z_track: float = 10.0
+    ptot_min: float = 40.0
+    theta_min: float = 1.0
+    theta_max: float = np.pi - 1
+    # dE/dx band: tdedx > amplitude * exp(-(p - p0) / slope) + offset
+    dedx_amplitude: float = 40.0
+    dedx_p0: float = 60.0
+    dedx_slope: float = 40.0
+    dedx_offset: float = 7000.0
+    dedx_p_min: float = 60.0
+    dedx_p_max: float = 500.0
+    # |p1 - p2| / (p1 + p2)
+    mom_balance: float = 0.3
+
+
+# output name -> input branch, in the order of `kpkmExp::Loop`
+EVENT_BRANCHES = {
+    "ebeam": "ebeam",
+    "emeas": "emeas0",
+    "demeas": "demeas0",
+    "runnum": "runnum",
+}
+# the leaf types of `kpkmExp::Loop`: ebeam/F, emeas/F, demeas/F, runnum/I
+EVENT_TYPES = {
+    "ebeam": np.float32,
+    "emeas": np.float32,
+    "demeas": np.float32,
+    "runnum": np.int32,
+}
+TRACK_BRANCHES = {
+    "charge": "tcharge",
+    "tptot": "tptot",
+    "tth": "tth",
+    "tphi": "tphi",
+    "tptotv": "tptotv",
+    "tthv": "tthv",
+    "tphiv": "tphiv",
+    "tdedx": "tdedx",
+}
+CUT_BRANCHES = ["tz", "tchi2r", "tchi2z", "tnhit"]
+
+COMPRESSIONS = {"zlib": up.ZLIB, "lzma": up.LZMA, "lz4": up.LZ4, "zstd": up.ZSTD}
+
+
+@dataclass(frozen=True)
+class OutputSchema:
+    """Branches and storage of the `kChargedTree` output.
+
+    With `fixed_size` the track branches are (K+, K-) float32[2] columns
+    instead of variable-length double arrays.
+    """
+
+    event_branches: tuple[str, ...] = tuple(EVENT_BRANCHES)
+    track_branches: tuple[str, ...] = tuple(TRACK_BRANCHES)
+    fixed_size: bool = False
+    compression: str = "zlib"
+    compression_level: int = 1
+
+    def make_compression(self):
+        return COMPRESSIONS[self.compression](self.compression_level)
+
+    def with_branches(self, names: list[str]) -> "OutputSchema":
+        """The schema with only the given output branches, in the input order."""
+        unknown = set(names) - set(EVENT_BRANCHES) - set(TRACK_BRANCHES)
+        if unknown:
+            raise ValueError(f"unknown output branches: {', '.join(sorted(unknown))}")
+        return replace(
+            self,
+            event_branches=tuple(name for name in EVENT_BRANCHES if name in names),
+            track_branches=tuple(name for name in TRACK_BRANCHES if name in names),
+        )
+
+
+SCHEMAS = {
+    # the branches of `kpkmExp::Loop`, but uproot writes the tracks as leaf lists
+    # with counters (`tptotv[ntptotv]/D`, `ntptotv`) instead of std::vector<double>,
+    # so only the Python readers (`eval_boost`, `eval_energy.py`) read the output
+    "full": OutputSchema(),
+    # only what `eval_boost` and `eval_energy.py` read; like "full", it isn't read
+    # by the C++ `Energy` class, which rejects both (`Energy::CheckLayout`)
+    "compact": OutputSchema(
+        event_branches=("emeas", "demeas", "runnum"),
+        track_branches=("tptotv", "tthv", "tphiv"),
+        fixed_size=True,
+        compression="zstd",
+        compression_level=5,
+    ),
+}
+
+
+def read_branches() -> list[str]:
+    return ["nt", *EVENT_BRANCHES.values(), *TRACK_BRANCHES.values(), *CUT_BRANCHES]
+
+
+def two_track_arrays(arrays: ak.Array) -> dict[str, np.ndarray]:
+    """Keep `nt == 2` events; track branches become (n, 2) NumPy arrays."""
+    # the branches are sliced one by one, `to_regular` of a field of a sliced
+    # record would see the unsliced tracks behind its index
+    is_two = ak.to_numpy(arrays["nt"] == 2)
+    columns = {
+        name: ak.to_numpy(arrays[name][is_two]) for name in EVENT_BRANCHES.values()
+    }
+    for name in [*TRACK_BRANCHES.values(), *CUT_BRANCHES]:
+        columns[name] = ak.to_numpy(ak.to_regular(arrays[name][is_two], axis=1))
+    return columns
+
+
+def track_mask(tracks: dict[str, np.ndarray], cuts: Cuts = Cuts()) -> np.ndarray:
+    """(n, 2) mask of tracks passing the quality, fiducial and dE/dx cuts.
+
+    Float_t values are compared in double precision, while the dE/dx band
+    is computed in single precision, as the Float_t expression of `kpkmExp::Loop`.
+    """
+    p32 = tracks["tptotv"]
+    p, theta = p32.astype(np.float64), tracks["tth"].astype(np.float64)
+    quality = (
+        (p > cuts.ptot_min)
+        & (tracks["tchi2r"] < cuts.chi2r)
+        & (tracks["tchi2z"] < cuts.chi2z)
+        & (tracks["tnhit"] >= cuts.nhit_min)
+    )
+    fiducial = (
+        (np.abs(tracks["tz"].astype(np.float64)) < cuts.z_track)
+        & (theta > cuts.theta_min)
+        & (theta < cuts.theta_max)
+    )
+    f32 = np.float32
+    dedx_band = f32(cuts.dedx_amplitude) * np.exp(
+        -(p32 - f32(cuts.dedx_p0)) / f32(cuts.dedx_slope)
+    ) + f32(cuts.dedx_offset)
+    dedx = (
+        (tracks["tdedx"].astype(np.float64) > dedx_band.astype(np.float64))
+        & (p > cuts.dedx_p_min)
+        & (p < cuts.dedx_p_max)
+    )
+    return quality & fiducial & dedx
+
+
+def event_mask(tracks: dict[str, np.ndarray], cuts: Cuts = Cuts()) -> np.ndarray:
+    """Mask of two-track events passing all cuts of `kpkmExp::Loop`."""
+    p = tracks["tptotv"]
+    balance = (np.abs(p[:, 0] - p[:, 1]) / (p[:, 0] + p[:, 1])).astype(np.float64)
+    return (
+        (tracks["tcharge"][:, 0] * tracks["tcharge"][:, 1] < 0)
+        & track_mask(tracks, cuts).all(axis=1)
+        & (balance < cuts.mom_balance)
+    )
+
+
+def kaon_pairs(tracks: dict[str, np.ndarray], mask: np.ndarray) -> dict:
+    """Selected events with the K+ track first, (n, 2) arrays for tracks."""
+    swap = tracks["tcharge"][mask, 0] < 0
+    columns: dict = {
+        name: tracks[branch][mask] for name, branch in EVENT_BRANCHES.items()
+    }
+    for name, branch in TRACK_BRANCHES.items():
+        pairs = tracks[branch][mask].astype(np.float64)
+        pairs[swap] = pairs[swap, ::-1]
+        columns[name] = pairs
+    return columns
+
+
+def kaon_columns(pairs: dict, schema: OutputSchema = SCHEMAS["full"]) -> dict:
+    """Output columns of the selected events in the given schema."""
+    columns = {
+        name: pairs[name].astype(EVENT_TYPES[name]) for name in schema.event_branches
+    }
+    for name in schema.track_branches:
+        if schema.fixed_size:
+            columns[name] = pairs[name].astype(np.float32)
+        else:
+            n_tracks = np.full(len(pairs[name]), 2)
+            columns[name] = ak.unflatten(pairs[name].ravel(), n_tracks)
+    return columns
+
+
+def select_events(
+    input: str,
+    output: Path,
+    cuts: Cuts = Cuts(),
+    step_size: int | str = "100 MB",
+    hists: bool = True,
+    schema: OutputSchema = SCHEMAS["full"],
+) -> tuple[int, int]:
+    """Select K+K- events from `tr_ph` tree into `kChargedTree`, like `kpkmExp::Loop`.
+
+    The track branches are not std::vector<double>, see `SCHEMAS`; the C++
+    `Energy` class needs the output of `kpkmExp::Loop` itself.
+
+    Parameters
+    ----------
+    input : str
+        path or URL of the file with `tr_ph` tree
+    output : Path
+        output file
+    cuts : Cuts
+        selection cuts
+    step_size : int | str
+        chunk size for `uproot.iterate`
+    hists : bool
+        also write the hKp, hKm (dE/dx vs p) and hMoms (p+ vs p-) histograms,
+        as `kpkmExp::Loop` does; hKp and hKm are 5000x5000 bins and cost
+        ~200 MB of memory each
+    schema : OutputSchema
+        output branches, their storage and compression, see `SCHEMAS`
+
+    Returns
+    -------
+    tuple[int, int]
+        numbers of events in the input tree and of selected events
+    """
+    n_entries, n_selected = 0, 0
+    h2d = {
+        "hKp": [np.linspace(0, 1000, 5001), np.linspace(0, 40000, 5001)],
+        "hKm": [np.linspace(0, 1000, 5001), np.linspace(0, 40000, 5001)],
+        "hMoms": [np.linspace(0, 1000, 1001), np.linspace(0, 1000, 1001)],
+    }
+    counts: dict[str, np.ndarray] = {}
+
+    with up.recreate(output, compression=schema.make_compression()) as file:
+        is_created = False
+        chunks = up.iterate(
+            {input: "tr_ph"}, read_branches(), step_size=step_size, library="ak"
+        )
+        for chunk in count():
+            with span("read tr_ph", "io", chunk=chunk) as info:
+                arrays = next(chunks, None)
+                info["events"] = 0 if arrays is None else len(arrays)
+            if arrays is None:
+                break
+            n_entries += len(arrays)
+            with span("select", "transform", chunk=chunk):
+                tracks = two_track_arrays(arrays)
+                mask = event_mask(tracks, cuts)
+                pairs = kaon_pairs(tracks, mask)
+                columns = kaon_columns(pairs, schema)
+            with span("write kChargedTree", "io", chunk=chunk):
+                if is_created:
+                    file["kChargedTree"].extend(columns)
+                else:
+                    file.mktree("kChargedTree", columns)
+                    is_created = True
+            n_selected += int(mask.sum())
+
+            if hists:
+                p, dedx = pairs["tptotv"], pairs["tdedx"]
+                # hMoms is filled before the K+ track is swapped to the front
+                raw_p = tracks["tptotv"][mask].astype(np.float64)
+                for name, (x, y) in {
+                    "hKp": (p[:, 0], dedx[:, 0]),
+                    "hKm": (p[:, 1], dedx[:, 1]),
+                    "hMoms": (raw_p[:, 1], raw_p[:, 0]),
+                }.items():
+                    h = np.histogram2d(x, y, bins=h2d[name])[0]
+                    counts[name] = counts.get(name, 0) + h
+
+        for name, h in counts.items():
+            file[name] = (h, *h2d[name])
+
+    print(f"Number of events in the tree = {n_entries}")
+    print(f"N Selected events = {n_selected}")
+    return n_entries, n_selected
@@ -0,0 +1,150 @@
+"""
+Event-for-event validation of the Python selection (`selection.py`)
+against the C++ one (`kpkmExp.cpp`) on a locally generated `tr_ph` tree,
+including the branch types of the output.
+
+Run from the `select` directory, ROOT is needed for the C++ part.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from pathlib import Path
+import subprocess as sub
+import sys
+
+import awkward as ak
+import numpy as np
+import uproot as up
+
+from selection import select_events
+
+
+def make_test_tree(output: Path, n_events: int = 100_000, seed: int = 0):
+    """Write a `tr_ph` tree with the branches used by the selection.
+
+    The track variables are spread around the cut values, so every cut
+    is exercised on both sides.
+    """
+    rng = np.random.default_rng(seed)
+    nt = rng.choice([1, 2, 2, 2, 3], size=n_events)
+    n_tracks = nt.sum()
+
+    def tracks(values: np.ndarray) -> ak.Array:
+        return ak.unflatten(values, nt)
+
+    f32 = np.float32
+    ptot = rng.uniform(20, 550, n_tracks).astype(f32)
+    track_record = ak.zip(
+        {
+            "tcharge": tracks(rng.choice([-1, 1], n_tracks).astype(np.int32)),
+            "tptot": tracks(ptot + rng.normal(0, 2, n_tracks).astype(f32)),
+            "tth": tracks(rng.uniform(0.5, np.pi - 0.5, n_tracks).astype(f32)),
+            "tphi": tracks(rng.uniform(0, 2 * np.pi, n_tracks).astype(f32)),
+            "tptotv": tracks(ptot),
+            "tthv": tracks(rng.uniform(0.5, np.pi - 0.5, n_tracks).astype(f32)),
+            "tphiv": tracks(rng.uniform(0, 2 * np.pi, n_tracks).astype(f32)),
+            "tdedx": tracks(rng.uniform(5000, 20000, n_tracks).astype(f32)),
+            "tz": tracks(rng.normal(0, 8, n_tracks).astype(f32)),
+            "tchi2r": tracks(rng.uniform(0, 20, n_tracks).astype(f32)),
+            "tchi2z": tracks(rng.uniform(0, 13, n_tracks).astype(f32)),
+            "tnhit": tracks(rng.integers(5, 30, n_tracks).astype(np.int32)),
+        }
+    )
+    emeas = rng.normal(509, 0.05, n_events).astype(f32)
+    with up.recreate(output) as file:
+        file.mktree(
+            "tr_ph",
+            {
+                "ebeam": np.float32,
+                "emeas": np.float32,
+                "demeas": np.float32,
+                "emeas0": np.float32,
+                "demeas0": np.float32,
+                "runnum": np.int32,
+                "track": track_record.type.content,
+            },
+            counter_name=lambda counted: "nt",
+            field_name=lambda outer, inner: inner,
+        )
+        file["tr_ph"].extend(
+            {
+                "ebeam": np.full(n_events, 509, dtype=f32),
+                "emeas": emeas,
+                "demeas": np.full(n_events, 0.01, dtype=f32),
+                "emeas0": emeas,
+                "demeas0": np.full(n_events, 0.01, dtype=f32),
+                "runnum": np.sort(rng.integers(60000, 60100, n_events)).astype(
+                    np.int32
+                ),
+                "track": track_record,
+            }
+        )
+
+
+def run_cpp_selection(input: Path, output: Path) -> int:
+    aux1, aux2 = '"', "\\"
+    command = f'root -l -q "select.cpp(\\{aux1 + "kpkmExp.cpp" + aux2}", \
+                \\{aux1 + "kpkmExp" + aux2}",\
+                \\{aux1 + input.as_posix() + aux2}", \
+                \\{aux1 + output.as_posix() + aux2}")"'
+    return sub.run(command, capture_output=True, shell=True).returncode
+
+
+def compare_layout(cpp_tree, py_tree) -> bool:
+    """Compare the branches and their types, e.g. std::vector<double> vs a
+    leaf list with a counter branch, that the C++ `Energy` class can't read."""
+    cpp_types, py_types = cpp_tree.typenames(), py_tree.typenames()
+    counters = {
+        branch.count_branch.name
+        for branch in py_tree.values()
+        if branch.count_branch is not None
+    }
+    is_same = True
+    for name in sorted(cpp_types.keys() - py_types.keys()):
+        print(f"{name}: missing in Python")
+        is_same = False
+    for name in sorted(py_types.keys() - cpp_types.keys()):
+        kind = "counter" if name in counters else "extra"
+        print(f"{name}: {kind} branch only in Python")
+        is_same = False
+    for name in sorted(cpp_types.keys() & py_types.keys()):
+        if cpp_types[name] != py_types[name]:
+            print(f"{name}: type C++ {cpp_types[name]}, Python {py_types[name]}")
+            is_same = False
+    return is_same
+
+
+def compare(cpp_output: Path, py_output: Path) -> bool:
+    with up.open(f"{cpp_output.as_posix()}:kChargedTree") as cpp_tree:  # type: ignore
+        with up.open(f"{py_output.as_posix()}:kChargedTree") as py_tree:  # type: ignore
+            is_same = compare_layout(cpp_tree, py_tree)
+            cpp = cpp_tree.arrays(library="ak")
+            py = py_tree.arrays(cpp.fields, library="ak")
+
+    if len(cpp) != len(py):
+        print(f"Selected events differ: C++ {len(cpp)}, Python {len(py)}")
+        return False
+    for field in cpp.fields:
+        mismatch = cpp[field] != py[field]
+        if mismatch.ndim > 1:
+            mismatch = ak.any(mismatch, axis=-1)
+        if ak.any(mismatch):
+            print(f"{field}: {ak.sum(mismatch)} events differ")
+            is_same = False
+    print(f"{len(cpp)} selected events compared: {'OK' if is_same else 'FAILED'}")
+    return is_same
+
+
+if __name__ == "__main__":
+    workdir = Path("validation")
+    workdir.mkdir(exist_ok=True)
+    test_tree = Path(workdir, "test_tr_ph.root")
+    cpp_output = Path(workdir, "kpkm_cpp.root")
+    py_output = Path(workdir, "kpkm_py.root")
+
+    make_test_tree(test_tree)
+    print(f"Test tree saved: {test_tree}")
+    if run_cpp_selection(test_tree, cpp_output) != 0:
+        sys.exit("C++ selection failed, is ROOT set up?")
+    select_events(test_tree.as_posix(), py_output)
+    sys.exit(0 if compare(cpp_output, py_output) else 1)
@@ -0,0 +1,153 @@
+"""
+Incremental monitoring on synthetic `kChargedTree` files against a full recompute.
+
+Developed by Daniel Ivanov (daniilivanov1606@gmail.com)
+"""
+
+from pathlib import Path
+import os
+import sys
+
+import awkward as ak
+import numpy as np
+import pytest
+import uproot as up
+
+sys.path.append(str(Path(__file__).parent.parent))
+from config import ROOT_ENV
+
+# `monitor` reads the root folder on import, the tests set it per test
+os.environ.setdefault(ROOT_ENV, str(Path(__file__).parent))
+import monitor
+from bench.synthetic import FIRST_RUN, make_kcharged_tree
+from eval import kch_energy
+from eval.graphs import read_graph
+from eval.kch_energy import evaluate_groups, fill_run_histograms
+from eval.run_monitor import PointMonitor, compton_last_run
+from eval.utils import Season, _table_runs
+
+N_EVENTS = 30000
+N_RUNS = 60
+
+
+@pytest.fixture
+def season(tmp_path: Path, monkeypatch) -> Season:
+    monkeypatch.setattr(monitor, "root_folder", tmp_path)
+    season = Season(
+        name="Phi2024",
+        season_info=Path(tmp_path, "tables/phi2024.csv"),
+        graphs_location=Path(tmp_path, "results/Phi2024/graphs"),
+        # no Compton tables, the points aren't averaged
+        compton_tables=Path(tmp_path, "tables/Compton/energy_points/PHI2024"),
+        output_tables=Path(tmp_path, "tables/k_charged/PHI2024"),
+    )
+    season.compton_tables.mkdir(parents=True)
+    Path(tmp_path, "data/Phi2024").mkdir(parents=True)
+    return season
+
+
+@pytest.fixture
+def full_tree(tmp_path: Path) -> Path:
+    """All events of the point, in the order of their runs."""
+    unsorted = Path(tmp_path, "unsorted.root")
+    runs = np.arange(FIRST_RUN, FIRST_RUN + N_RUNS)
+    make_kcharged_tree(unsorted, N_EVENTS, runs=runs, chunk_size=N_EVENTS // 3)
+    arrays = up.open(unsorted)["kChargedTree"].arrays(library="ak")
+    arrays = arrays[np.argsort(ak.to_numpy(arrays["runnum"]), kind="stable")]
+    output = Path(tmp_path, "full.root")
+    with up.recreate(output) as file:
+        file.mktree("kChargedTree", {name: arrays[name] for name in arrays.fields})
+    return output
+
+
+def write_entries(source: Path, output: Path, n_entries: int):
+    """Rewrite `output` with the first entries of `source`, as if appended to."""
+    arrays = up.open(source)["kChargedTree"].arrays(entry_stop=n_entries, library="ak")
+    with up.recreate(output) as file:
+        file.mktree("kChargedTree", {name: arrays[name] for name in arrays.fields})
+
+
+def test_incremental_matches_full_recompute(
+    season: Season, full_tree: Path, tmp_path: Path, monkeypatch
+):
+    fits = []
+
+    def counted_fit_peak(*args, **kwargs):
+        fits.append(args)
+        return fit_peak(*args, **kwargs)
+
+    fit_peak = kch_energy.fit_peak
+    monkeypatch.setattr(kch_energy, "fit_peak", counted_fit_peak)
+
+    input = Path(tmp_path, "data/Phi2024/kpkm_scan2024_e509.root")
+    state = Path(tmp_path, "cache/monitor/Phi2024.pkl")
+    n_fits = []
+    for n_entries in [N_EVENTS // 3, 2 * N_EVENTS // 3, N_EVENTS, N_EVENTS]:
+        write_entries(full_tree, input, n_entries)
+        monitors = monitor.load_monitors(state)
+        fits.clear()
+        monitor.poll(season, monitors)
+        monitor.save_monitors(state, monitors)
+        n_fits.append(len(fits))
+    monkeypatch.setattr(kch_energy, "fit_peak", fit_peak)
+
+    point = monitor.load_monitors(state)[input.name]
+    full = fill_run_histograms(full_tree)
+    np.testing.assert_array_equal(point.hists.runs, full.runs)
+    np.testing.assert_array_equal(point.hists.counts, full.counts)
+    np.testing.assert_array_equal(point.hists.emeas, full.emeas)
+
+    recomputed = PointMonitor(full_tree)
+    recomputed.update()
+    np.testing.assert_array_equal(point.tot_pz.counts, recomputed.tot_pz.counts)
+    assert point.tot_pz_moments.mean == pytest.approx(recomputed.tot_pz_moments.mean)
+    assert point.run_tot_pz.keys() == recomputed.run_tot_pz.keys()
+
+    groups = evaluate_groups(full)
+    graph = read_graph(Path(season.graphs_location, "graph_scan2024_e509.root"))
+    np.testing.assert_array_equal(graph.runs, groups.first_runs)
+    energies = np.where(groups.energies == 0, np.nan, groups.energies)
+    np.testing.assert_allclose(graph.energies, energies, atol=1e-4)
+
+    # the runs come in order, so a poll refits only the groups of its new runs
+    # and of the run split by the previous poll
+    runnum = up.open(full_tree)["kChargedTree"]["runnum"].array(library="np")
+    n_runs = [len(np.unique(runnum[:n])) for n in [N_EVENTS // 3, 2 * N_EVENTS // 3]]
+    assert n_fits[0] == n_runs[0]
+    assert n_fits[1] <= n_runs[1] - n_runs[0] + 1
+    assert n_fits[-1] == 0
+
+
+def test_evaluate_groups_refits_only_changed_groups(full_tree: Path, monkeypatch):
+    hists = fill_run_histograms(full_tree)
+    groups = evaluate_groups(hists, max_group_size=5)
+
+    fits = []
+    fit_peak = kch_energy.fit_peak
+    monkeypatch.setattr(
+        kch_energy, "fit_peak", lambda *args: fits.append(args) or fit_peak(*args)
+    )
+    changed = hists.runs[[7, 8]]
+    refitted = evaluate_groups(
+        hists, max_group_size=5, previous=groups, changed_runs=changed
+    )
+    # runs of the same emeas are grouped, every synthetic run has its own
+    assert len(fits) == 2
+    for name in ["first_runs", "last_runs", "energies", "energy_errors"]:
+        np.testing.assert_array_equal(getattr(refitted, name), getattr(groups, name))
+
+
+def test_compton_last_run_rereads_only_changed_tables(season: Season):
+    table = Path(season.compton_tables, "509_60000.csv")
+    table.write_text("run_first,run_last,e_mean\n60000,60003,509.0\n")
+    assert compton_last_run(season, "509") == 60003
+
+    misses = _table_runs.cache_info().misses
+    for _ in range(3):
+        assert compton_last_run(season, "509") == 60003
+    assert _table_runs.cache_info().misses == misses
+
+    with open(table, "a") as file:
+        file.write("60004,60010,509.1\n")
+    assert compton_last_run(season, "509") == 60010
+    assert compton_last_run(season, "511") == 0